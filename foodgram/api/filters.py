@@ -2,6 +2,13 @@ from django_filters import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe, Tag, Ingredient
+from .utils.search import search_recipes
+from .utils.tag_masks import filter_by_tags
+
+TAGS_MODES = (
+    ('any', 'Любой из тегов'),
+    ('all', 'Все теги'),
+)
 
 
 class IngredientSearchFilter(SearchFilter):
@@ -21,7 +28,12 @@ class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         queryset=Tag.objects.all(),
-        to_field_name='slug'
+        to_field_name='slug',
+        method='tags_filter',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES,
+        method='tags_mode_filter',
     )
     is_favorited = filters.NumberFilter(
         method='is_favorited_filter',
@@ -29,16 +41,35 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.NumberFilter(
         method='is_in_shopping_cart_filter',
     )
+    search = filters.CharFilter(
+        method='search_filter',
+    )
 
     class Meta:
         model = Recipe
         fields = (
             'author',
             'tags',
+            'tags_mode',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
+        )
+
+    def tags_filter(self, queryset, name, value):
+        """Теги по маске рецепта: tags_mode=all требует все теги."""
+        if not value:
+            return queryset
+        return filter_by_tags(
+            queryset,
+            value,
+            match_all=self.form.cleaned_data.get('tags_mode') == 'all'
         )
 
+    def tags_mode_filter(self, queryset, name, value):
+        """Режим применяется в tags_filter."""
+        return queryset
+
     def is_favorited_filter(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
             return queryset.filter(recipe__user=self.request.user)
@@ -48,3 +79,7 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shoppingcart__user=self.request.user)
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        """Полнотекстовый поиск с сортировкой по релевантности."""
+        return search_recipes(queryset, value)
@@ -0,0 +1,245 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.http import QueryDict
+from rest_framework.test import APIRequestFactory
+
+from api.filters import RecipeFilter
+from api.utils.functions import annotate_recipes
+from api.utils.paginators import CustomPaginator
+from api.utils.seeding import scratch_database, seed_data
+from recipes.constants import PAGE_SIZE
+from recipes.models import (
+    Follow,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    User
+)
+
+# Признаки полного просмотра таблицы и сортировки без индекса в планах.
+SEQUENTIAL_SCANS = {
+    'sqlite': lambda line: 'SCAN ' in line and 'USING' not in line,
+    'postgresql': lambda line: 'Seq Scan' in line,
+}
+SORTS = {
+    'sqlite': lambda line: 'USE TEMP B-TREE' in line,
+    'postgresql': lambda line: line.strip(' ->').startswith('Sort'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN on the hot queries of the API, flag sequential scans '
+        'and sorts, and time each query'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, metavar='RECIPES',
+            help='Audit a temporary test database seeded with RECIPES '
+                 'recipes instead of the configured database.'
+        )
+        parser.add_argument(
+            '--baseline', metavar='MIGRATION',
+            help='With --seed: audit without the indexes added to recipes '
+                 'models after this migration first, then with them, and '
+                 'compare timings. The schema stays current.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of runs per query for timings.'
+        )
+
+    def filtered(self, user, **params):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = user
+        query = QueryDict(mutable=True)
+        for key, value in params.items():
+            query.setlist(key, value if isinstance(value, list) else [value])
+        return RecipeFilter(
+            query,
+            queryset=Recipe.objects.with_user_flags(user),
+            request=request
+        ).qs
+
+    def catalogue(self):
+        """Запросы из api/views.py и api/filters.py на реальных данных."""
+        user = User.objects.filter(shoppingcart__isnull=False).first()
+        recipe = Recipe.objects.order_by('id').first()
+        if user is None or recipe is None:
+            raise CommandError(
+                'The database has no data to audit, use --seed.'
+            )
+        tag = Tag.objects.first()
+        paginator = CustomPaginator()
+        ordering = paginator.get_ordering(Recipe.objects.all())
+        middle = Recipe.objects.order_by(*ordering)[
+            Recipe.objects.count() // 2
+        ]
+        values = [getattr(middle, key.lstrip('-')) for key in ordering]
+        page = list(
+            Recipe.objects.order_by(*ordering).values_list('id', flat=True)[
+                :PAGE_SIZE
+            ]
+        )
+        authors = list(
+            User.objects.filter(
+                following__user=user
+            ).values_list('id', flat=True)[:PAGE_SIZE]
+        )
+        return (
+            ('recipe feed', self.filtered(AnonymousUser())),
+            ('recipe feed with user flags', self.filtered(user)),
+            (
+                'recipe feed, cursor page',
+                self.filtered(user).filter(
+                    paginator.get_keyset_filter(ordering, values)
+                ).order_by(*ordering)
+            ),
+            (
+                'recipes by author',
+                self.filtered(user, author=recipe.author_id)
+            ),
+            ('recipes by tag', self.filtered(user, tags=tag.slug)),
+            ('favorite recipes', self.filtered(user, is_favorited='1')),
+            ('recipes in cart', self.filtered(user, is_in_shopping_cart='1')),
+            (
+                'recipe ingredients prefetch',
+                RecipeIngredient.objects.filter(
+                    recipe__in=page
+                ).select_related('ingredient')
+            ),
+            ('recipe tags prefetch', Tag.objects.filter(recipes__in=page)),
+            (
+                'subscriptions',
+                annotate_recipes(User.objects.filter(following__user=user))
+            ),
+            (
+                'subscription recipes prefetch',
+                Recipe.objects.filter(author__in=authors)
+            ),
+            (
+                'follow lookup',
+                Follow.objects.filter(author=recipe.author_id, user=user)
+            ),
+            (
+                'followers of author',
+                Follow.objects.filter(author=recipe.author_id)
+            ),
+            (
+                'subscribed authors',
+                user.follower.values_list('author_id', flat=True)
+            ),
+            (
+                'shopping list download',
+                ShoppingListItem.objects.filter(user=user).values(
+                    'ingredient__name',
+                    'ingredient__measurement_unit',
+                    'amount'
+                ).order_by('ingredient__name')
+            ),
+            (
+                'carts of recipe',
+                ShoppingCart.objects.filter(
+                    recipe=recipe
+                ).values_list('user_id', flat=True)
+            ),
+        )
+
+    def audit(self, repeat):
+        results = {}
+        is_scan = SEQUENTIAL_SCANS.get(connection.vendor)
+        is_sort = SORTS.get(connection.vendor)
+        for name, queryset in self.catalogue():
+            queryset = queryset[:PAGE_SIZE] if queryset.ordered else queryset
+            plan = queryset.explain().splitlines()
+            flags = [
+                line.strip() for line in plan
+                if is_scan and is_scan(line) or is_sort and is_sort(line)
+            ]
+            start = perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            results[name] = (perf_counter() - start) / repeat * 1000
+            self.stdout.write(
+                f'{"FLAG" if flags else "ok":<5}{name:<32}'
+                f'{results[name]:>10.3f} ms'
+            )
+            for line in flags if self.verbosity < 2 else plan:
+                self.stdout.write(f'{"":<7}{line.strip()}')
+        return results
+
+    def added_indexes(self, baseline):
+        """Индексы Meta.indexes моделей recipes, добавленные после baseline."""
+        loader = MigrationLoader(connection)
+        if ('recipes', baseline) not in loader.graph.nodes:
+            raise CommandError(f'Unknown recipes migration {baseline!r}.')
+        state = loader.project_state(('recipes', baseline))
+        added = []
+        for model in apps.get_app_config('recipes').get_models():
+            key = ('recipes', model._meta.model_name)
+            before = (
+                {index.name for index in state.models[key].options.get(
+                    'indexes', ()
+                )}
+                if key in state.models else set()
+            )
+            added += [
+                (model, index) for index in model._meta.indexes
+                if index.name not in before
+            ]
+        return added
+
+    @contextmanager
+    def without_indexes(self, indexes):
+        """Удаляет индексы на время блока и создает их заново."""
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        try:
+            yield
+        finally:
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+
+    def compare(self, before, after):
+        self.stdout.write(
+            f'\n{"query":<37}{"before, ms":>12}{"after, ms":>12}'
+        )
+        for name, time in after.items():
+            self.stdout.write(
+                f'{name:<37}{before[name]:>12.3f}{time:>12.3f}'
+            )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        repeat = options['repeat']
+        if not options['seed']:
+            self.audit(repeat)
+            return
+        with scratch_database():
+            seed_data(
+                recipes=options['seed'],
+                users=max(options['seed'] // 10, 2)
+            )
+            if not options['baseline']:
+                self.audit(repeat)
+                return
+            indexes = self.added_indexes(options['baseline'])
+            with self.without_indexes(indexes):
+                self.stdout.write(
+                    f'Without indexes added after {options["baseline"]}: '
+                    f'{", ".join(index.name for _, index in indexes)}'
+                )
+                before = self.audit(repeat)
+            self.stdout.write('\nAll indexes:')
+            self.compare(before, self.audit(repeat))
@@ -0,0 +1,461 @@
+import gc
+import json
+import os
+from contextlib import contextmanager
+from statistics import median, quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.urls import router
+from api.utils.caching import CachedResponseMixin
+from api.utils.seeding import (
+    image_data,
+    scratch_database,
+    seed_data,
+    store_seed_image,
+    SEED_IMAGE
+)
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    User
+)
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'data', 'bench_baseline.json')
+DEFAULT_SIZES = (1000, 10000)
+BULK_SIZE = 20
+# Меньший рост p95 не считается регрессией при любом --tolerance.
+# Без --tolerance p95 не проверяется: задержки на разных машинах
+# и при разной нагрузке несравнимы, а число запросов воспроизводимо.
+MIN_REGRESSION_MS = 2
+# Активация и смена учетных данных djoser в замеры не входят.
+SKIPPED_ROUTES = {
+    'users-activation',
+    'users-resend-activation',
+    'users-reset-password',
+    'users-reset-password-confirm',
+    'users-reset-username',
+    'users-reset-username-confirm',
+    'users-set-password',
+    'users-set-username',
+}
+
+
+class RequestCase:
+    """
+    Запрос к API. before выполняется перед каждым замером вне
+    измеряемого времени; если path не задан, путь возвращает before.
+    """
+
+    def __init__(self, name, client, method, path=None, data=None,
+                 before=None):
+        self.name = name
+        self.client = client
+        self.method = method
+        self.path = path
+        self.data = data
+        self.before = before
+
+    def prepare(self):
+        path = self.before() if self.before else None
+        return self.path or path
+
+    def request(self, path):
+        response = getattr(self.client, self.method)(
+            path, self.data, format='json'
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+def add_rows(model, user, recipes):
+    """Добавляет рецепты в избранное или корзину с сигналами модели."""
+    for recipe in recipes:
+        model.objects.get_or_create(user=user, recipe=recipe)
+
+
+@contextmanager
+def response_cache(enabled):
+    """Без кеша ответов измеряется работа представлений, а не кеша."""
+    timeout = CachedResponseMixin.cache_timeout
+    if not enabled:
+        CachedResponseMixin.cache_timeout = 0
+    try:
+        yield
+    finally:
+        CachedResponseMixin.cache_timeout = timeout
+
+
+def token_client(user=None):
+    """Клиент API, аутентифицированный токеном, как фронтенд."""
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every API route on synthetic datasets of several '
+        'sizes: query counts and p50/p95 latency compared with a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+            help='Dataset sizes in recipes; users are a tenth of that.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Measured requests per route.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Requests per route before measuring.'
+        )
+        parser.add_argument(
+            '--cached', action='store_true',
+            help='Keep the response cache enabled.'
+        )
+        parser.add_argument(
+            '--baseline', default=BASELINE_PATH,
+            help='Baseline file to compare with.'
+        )
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Store the results as the baseline.'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Fail if a route issues more queries than in the baseline '
+                 'or, with --tolerance, its p95 exceeds the baseline by '
+                 'more than that.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float,
+            help='Allowed relative p95 increase for --check, e.g. 0.5. '
+                 'Without it only query counts are checked.'
+        )
+
+    def recipe_data(self, ingredients, tags):
+        return {
+            'name': 'Тестовый рецепт',
+            'text': 'Описание',
+            'cooking_time': 30,
+            'image': image_data(),
+            'tags': [tag.id for tag in tags[:2]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 100}
+                for ingredient in ingredients[:8]
+            ],
+        }
+
+    def cases(self):
+        """Запросы ко всем маршрутам api/urls.py на засеянных данных."""
+        reader = User.objects.filter(
+            shoppingcart__isnull=False,
+            favorite__isnull=False,
+            follower__isnull=False,
+            recipes__isnull=False
+        ).distinct().order_by('id').first()
+        if reader is None:
+            raise CommandError('The dataset is too small.')
+        author = User.objects.order_by('-recipes_count', 'id').first()
+        target = User.objects.exclude(
+            pk=reader.pk
+        ).exclude(following__user=reader).order_by('id').first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        own = Recipe.objects.filter(author=reader).order_by('id').first()
+        others = list(
+            Recipe.objects.exclude(author=reader).order_by('id')[:BULK_SIZE]
+        )
+        cart = list(Recipe.objects.filter(shoppingcart__user=reader))
+        tags = list(Tag.objects.order_by('id'))
+        ingredients = list(Ingredient.objects.order_by('id'))
+        anonymous = token_client()
+        user = token_client(reader)
+        recipe_data = self.recipe_data(ingredients, tags)
+        ids = {'recipes': [item.id for item in others]}
+
+        def seeded_recipe():
+            # Обработка изображения удаляет исходный файл.
+            store_seed_image()
+            created = Recipe.objects.create(
+                name='Рецепт для удаления',
+                text='Описание',
+                cooking_time=10,
+                author=reader,
+                image=SEED_IMAGE
+            )
+            return f'/api/recipes/{created.id}/'
+
+        def toggle(model, present, recipes=(others[0],)):
+            def before():
+                if present:
+                    add_rows(model, reader, recipes)
+                else:
+                    model.objects.filter(
+                        user=reader, recipe__in=recipes
+                    ).delete()
+            return before
+
+        def follow(present):
+            def before():
+                if present:
+                    Follow.objects.get_or_create(user=reader, author=target)
+                else:
+                    Follow.objects.filter(user=reader, author=target).delete()
+            return before
+
+        return (
+            RequestCase('api root', user, 'get', '/api/'),
+            RequestCase('users list', anonymous, 'get', '/api/users/'),
+            RequestCase(
+                'user detail', user, 'get',
+                f'/api/users/{author.id}/'
+            ),
+            RequestCase('current user', user, 'get', '/api/users/me/'),
+            RequestCase(
+                'subscriptions', user, 'get',
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            RequestCase(
+                'subscribe', user, 'post',
+                f'/api/users/{target.id}/subscribe/',
+                before=follow(False)
+            ),
+            RequestCase(
+                'unsubscribe', user, 'delete',
+                f'/api/users/{target.id}/subscribe/',
+                before=follow(True)
+            ),
+            RequestCase('tags list', anonymous, 'get', '/api/tags/'),
+            RequestCase(
+                'tag detail', anonymous, 'get',
+                f'/api/tags/{tags[0].slug}/'
+            ),
+            RequestCase(
+                'recipes, anonymous', anonymous, 'get',
+                '/api/recipes/'
+            ),
+            RequestCase('recipes', user, 'get', '/api/recipes/'),
+            RequestCase(
+                'recipes by tags', user, 'get',
+                f'/api/recipes/?tags={tags[0].slug}&tags={tags[1].slug}'
+            ),
+            RequestCase(
+                'recipes by author', user, 'get',
+                f'/api/recipes/?author={author.id}'
+            ),
+            RequestCase(
+                'favorite recipes', user, 'get',
+                '/api/recipes/?is_favorited=1'
+            ),
+            RequestCase(
+                'recipes in cart', user, 'get',
+                '/api/recipes/?is_in_shopping_cart=1'
+            ),
+            RequestCase(
+                'recipe search', user, 'get',
+                '/api/recipes/?search=%D1%81%D1%83%D0%BF'
+            ),
+            RequestCase(
+                'recipe detail', user, 'get',
+                f'/api/recipes/{recipe.id}/'
+            ),
+            RequestCase(
+                'recipe create', user, 'post',
+                '/api/recipes/', recipe_data
+            ),
+            RequestCase(
+                'recipe update', user, 'patch', f'/api/recipes/{own.id}/',
+                recipe_data
+            ),
+            RequestCase('recipe delete', user, 'delete', before=seeded_recipe),
+            RequestCase(
+                'favorite add', user, 'post',
+                f'/api/recipes/{others[0].id}/favorite/',
+                before=toggle(Favorite, False)
+            ),
+            RequestCase(
+                'favorite remove', user, 'delete',
+                f'/api/recipes/{others[0].id}/favorite/',
+                before=toggle(Favorite, True)
+            ),
+            RequestCase(
+                'cart add', user, 'post',
+                f'/api/recipes/{others[0].id}/shopping_cart/',
+                before=toggle(ShoppingCart, False)
+            ),
+            RequestCase(
+                'cart remove', user, 'delete',
+                f'/api/recipes/{others[0].id}/shopping_cart/',
+                before=toggle(ShoppingCart, True)
+            ),
+            RequestCase(
+                'favorite bulk add', user, 'post', '/api/recipes/favorite/',
+                ids, before=toggle(Favorite, False, others)
+            ),
+            RequestCase(
+                'favorite bulk remove', user, 'delete',
+                '/api/recipes/favorite/',
+                ids, before=toggle(Favorite, True, others)
+            ),
+            RequestCase(
+                'cart bulk add', user, 'post', '/api/recipes/shopping_cart/',
+                ids, before=toggle(ShoppingCart, False, others)
+            ),
+            RequestCase(
+                'cart bulk remove', user, 'delete',
+                '/api/recipes/shopping_cart/',
+                ids, before=toggle(ShoppingCart, True, others)
+            ),
+            RequestCase(
+                'clear cart', user, 'delete',
+                '/api/recipes/clear_shopping_cart/',
+                before=toggle(ShoppingCart, True, cart)
+            ),
+            RequestCase(
+                'download shopping list', user, 'get',
+                '/api/recipes/download_shopping_cart/'
+            ),
+            RequestCase(
+                'ingredients list', anonymous, 'get',
+                '/api/ingredients/'
+            ),
+            RequestCase(
+                'ingredient search', anonymous, 'get',
+                '/api/ingredients/?name=%D0%B8%D0%BD%D0%B3'
+            ),
+            RequestCase(
+                'ingredient detail', anonymous, 'get',
+                f'/api/ingredients/{ingredients[0].id}/'
+            ),
+        )
+
+    def measure(self, case, repeat, warmup):
+        times = []
+        queries = 0
+        for number in range(warmup + repeat):
+            path = case.prepare()
+            # Журнал запросов ограничен, а сборка мусора искажает p95.
+            connection.queries_log.clear()
+            gc.collect()
+            with CaptureQueriesContext(connection) as context:
+                start = perf_counter()
+                response = case.request(path)
+                elapsed = (perf_counter() - start) * 1000
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{case.name}: {response.status_code} '
+                    f'{response.content[:200]!r}'
+                )
+            if number >= warmup:
+                times.append(elapsed)
+                queries = max(queries, len(context.captured_queries))
+        return response.resolver_match.url_name, {
+            'queries': queries,
+            'p50_ms': round(median(times), 2),
+            'p95_ms': round(quantiles(times, n=20)[-1], 2),
+        }
+
+    def run(self, size, options):
+        store_seed_image()
+        seed_data(
+            recipes=size,
+            users=max(size // 10, 10),
+            ingredients=2000,
+            vary=True
+        )
+        results = {}
+        routes = set()
+        for case in self.cases():
+            route, results[case.name] = self.measure(
+                case, options['repeat'], options['warmup']
+            )
+            routes.add(route)
+        missing = {
+            pattern.name for pattern in router.urls
+        } - routes - SKIPPED_ROUTES
+        if missing:
+            self.stderr.write(f'Not benchmarked: {", ".join(sorted(missing))}')
+        return results
+
+    def is_regression(self, result, baseline, tolerance):
+        return baseline is not None and (
+            result['queries'] > baseline['queries']
+            or tolerance is not None and result['p95_ms'] > max(
+                baseline['p95_ms'] * (1 + tolerance),
+                baseline['p95_ms'] + MIN_REGRESSION_MS
+            )
+        )
+
+    def report(self, size, results, baseline, tolerance):
+        self.stdout.write(
+            f'\n{size} recipes\n{"route":<26}{"queries":>8}{"p50, ms":>10}'
+            f'{"p95, ms":>10}{"baseline q":>12}{"baseline p95":>14}'
+        )
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            flag = ''
+            if self.is_regression(result, before, tolerance):
+                regressions.append(name)
+                flag = '  REGRESSION'
+            self.stdout.write(
+                f'{name:<26}{result["queries"]:>8}{result["p50_ms"]:>10.2f}'
+                f'{result["p95_ms"]:>10.2f}'
+                + (
+                    f'{before["queries"]:>12}{before["p95_ms"]:>14.2f}'
+                    if before else f'{"-":>12}{"-":>14}'
+                )
+                + flag
+            )
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 2:
+            raise CommandError('--repeat must be at least 2.')
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        results = {}
+        regressions = []
+        with response_cache(options['cached']), scratch_database():
+            for size in options['sizes']:
+                # Замеры с кешем ответов хранятся отдельно.
+                key = f'{size}, cached' if options['cached'] else str(size)
+                call_command('flush', interactive=False, verbosity=0)
+                results[key] = self.run(size, options)
+                regressions += [
+                    f'{name} ({key})' for name in self.report(
+                        key,
+                        results[key],
+                        baseline.get(key, {}),
+                        options['tolerance']
+                    )
+                ]
+        if options['save']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(
+                    {**baseline, **results}, file,
+                    ensure_ascii=False, indent=2
+                )
+                file.write('\n')
+            self.stdout.write(f'Baseline saved to {options["baseline"]}.')
+        if options['check'] and regressions:
+            raise CommandError(f'Regressions: {", ".join(regressions)}.')
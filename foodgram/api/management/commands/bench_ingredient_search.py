@@ -0,0 +1,57 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.serializers import IngredientSerializer
+from api.utils.search import ingredient_index
+from recipes.models import Ingredient
+
+DEFAULT_PREFIXES = ('а', 'ба', 'мол', 'сыр', 'я', 'соль', 'томат')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare ingredient autocomplete through the ORM (^name filter) '
+        'with the in-memory prefix index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'prefixes', nargs='*', default=DEFAULT_PREFIXES,
+            help='Prefixes to search for.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Number of searches per prefix.'
+        )
+
+    def orm_search(self, prefix):
+        return IngredientSerializer(
+            Ingredient.objects.filter(name__istartswith=prefix),
+            many=True
+        ).data
+
+    def index_search(self, prefix):
+        return ingredient_index.search((prefix,))
+
+    def measure(self, search, prefix, repeat):
+        start = perf_counter()
+        for _ in range(repeat):
+            search(prefix)
+        return (perf_counter() - start) / repeat * 1000
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        ingredient_index.search()
+        self.stdout.write(
+            f'{"prefix":<10}{"rows":>6}{"orm, ms":>12}'
+            f'{"index, ms":>12}{"speedup":>10}'
+        )
+        for prefix in options['prefixes']:
+            rows = len(self.index_search(prefix))
+            orm = self.measure(self.orm_search, prefix, repeat)
+            index = self.measure(self.index_search, prefix, repeat)
+            self.stdout.write(
+                f'{prefix:<10}{rows:>6}{orm:>12.3f}'
+                f'{index:>12.3f}{orm / index:>9.1f}x'
+            )
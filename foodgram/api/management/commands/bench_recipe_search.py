@@ -0,0 +1,84 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.utils.search import search_recipes
+from api.utils.seeding import scratch_database, seed_data
+from recipes.constants import PAGE_SIZE
+from recipes.models import Recipe
+
+DEFAULT_QUERIES = ('суп', 'курица', 'пирог грибы', 'сыр запечь', 'шоколад')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare recipe search through icontains with the full-text '
+        'search in a temporary database of synthetic recipes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries', nargs='*', default=DEFAULT_QUERIES,
+            help='Search queries.'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=100000,
+            help='Number of synthetic recipes.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help='Number of searches per query.'
+        )
+
+    def naive_search(self, text):
+        queryset = Recipe.objects.all()
+        for term in text.split():
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(text__icontains=term)
+            )
+        return queryset
+
+    def full_text_search(self, text):
+        return search_recipes(Recipe.objects.all(), text)
+
+    def measure(self, search, text, repeat):
+        """Время первой страницы и подсчета результатов, мс."""
+        start = perf_counter()
+        for _ in range(repeat):
+            queryset = search(text)
+            list(queryset[:PAGE_SIZE])
+            count = queryset.count()
+        return (perf_counter() - start) / repeat * 1000, count
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with scratch_database():
+            start = perf_counter()
+            seed_data(
+                recipes=options['recipes'],
+                users=max(options['recipes'] // 100, 2),
+                per_recipe=2,
+                per_user=5,
+                follows=2
+            )
+            self.stdout.write(
+                f'Seeded {options["recipes"]} recipes in '
+                f'{perf_counter() - start:.1f} s'
+            )
+            self.stdout.write(
+                f'{"query":<16}{"icontains":>20}{"full-text":>20}'
+                f'{"speedup":>10}'
+            )
+            for text in options['queries']:
+                naive, naive_count = self.measure(
+                    self.naive_search, text, repeat
+                )
+                full_text, count = self.measure(
+                    self.full_text_search, text, repeat
+                )
+                self.stdout.write(
+                    f'{text:<16}{naive:>10.2f} ms{naive_count:>7}'
+                    f'{full_text:>10.2f} ms{count:>7}'
+                    f'{naive / full_text:>9.1f}x'
+                )
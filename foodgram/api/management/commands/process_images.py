@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.utils.images import apply_rendered, is_ready, render_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Process recipe images and build their variants in parallel. '
+        'Picks up images left unprocessed by the background workers '
+        'and backfills variants for existing recipes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of worker processes (default: CPU count).'
+        )
+
+    def handle(self, *args, **options):
+        pending = [
+            (recipe.id, recipe.image.name)
+            for recipe in Recipe.objects.exclude(image='').only(
+                'id', 'image', 'image_variants'
+            ).iterator()
+            if not is_ready(recipe)
+        ]
+        connections.close_all()
+        processed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(render_image, name): (recipe_id, name)
+                for recipe_id, name in pending
+            }
+            for future in as_completed(futures):
+                recipe_id, name = futures[future]
+                try:
+                    processed += apply_rendered(
+                        recipe_id, name, *future.result()
+                    )
+                except Exception as error:
+                    self.stderr.write(f'{name}: {error}')
+        self.stdout.write(
+            f'Processed {processed} of {len(pending)} images'
+        )
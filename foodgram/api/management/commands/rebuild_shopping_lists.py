@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the materialized shopping lists with the shopping carts '
+        'and rebuild the rows that differ'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report differences, fail if there are any.'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Limit to the given user id (may be repeated).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per bulk query.'
+        )
+
+    def expected(self, carts):
+        rows = carts.filter(
+            recipe__recipe_ingredients__isnull=False
+        ).values_list(
+            'user_id', 'recipe__recipe_ingredients__ingredient_id'
+        ).annotate(
+            total=Sum('recipe__recipe_ingredients__amount')
+        ).order_by()
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows.iterator()
+        }
+
+    def handle(self, *args, **options):
+        carts = ShoppingCart.objects.all()
+        items = ShoppingListItem.objects.all()
+        if options['users']:
+            carts = carts.filter(user__in=options['users'])
+            items = items.filter(user__in=options['users'])
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            expected = self.expected(carts)
+            actual = {
+                (item.user_id, item.ingredient_id): item
+                for item in items.only(
+                    'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            missing = expected.keys() - actual.keys()
+            extra = actual.keys() - expected.keys()
+            wrong = [
+                actual[key] for key in expected.keys() & actual.keys()
+                if actual[key].amount != expected[key]
+            ]
+            self.stdout.write(
+                f'{len(expected)} expected rows: {len(missing)} missing, '
+                f'{len(extra)} extra, {len(wrong)} with a wrong amount'
+            )
+            if not (missing or extra or wrong):
+                return
+            if options['check']:
+                raise CommandError('Shopping lists are out of date.')
+            ShoppingListItem.objects.filter(
+                pk__in=[actual[key].pk for key in extra]
+            ).delete()
+            for item in wrong:
+                item.amount = expected[(item.user_id, item.ingredient_id)]
+            ShoppingListItem.objects.bulk_update(
+                wrong, ('amount',), batch_size=batch_size
+            )
+            ShoppingListItem.objects.bulk_create(
+                [
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=expected[(user_id, ingredient_id)]
+                    )
+                    for user_id, ingredient_id in missing
+                ],
+                batch_size=batch_size
+            )
+        self.stdout.write(self.style.SUCCESS('Shopping lists rebuilt.'))
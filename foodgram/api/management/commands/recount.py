@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.utils.counters import recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the denormalized favorite, cart, follower and recipe '
+        'counters with the data and fix the ones that differ'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report differences, fail if there are any.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            result = recount(check=options['check'])
+        for name, wrong in result.items():
+            self.stdout.write(f'{name:<24}{wrong:>8} wrong')
+        if not any(result.values()):
+            return
+        if options['check']:
+            raise CommandError('Counters are out of date.')
+        self.stdout.write(self.style.SUCCESS('Counters fixed.'))
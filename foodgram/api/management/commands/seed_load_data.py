@@ -0,0 +1,79 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.seeding import seed_data, store_seed_image
+from recipes.models import Favorite, Follow, RecipeIngredient, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the configured database with a deterministic synthetic '
+        'dataset of users, recipes, favorites, carts and follows'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Number of users.'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='Number of recipes.'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Number of ingredients.'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=8,
+            help='Number of tags.'
+        )
+        parser.add_argument(
+            '--per-recipe', type=int, default=8,
+            help='Average number of ingredients per recipe.'
+        )
+        parser.add_argument(
+            '--per-user', type=int, default=20,
+            help='Average number of favorites and of cart recipes '
+                 'per user.'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Average number of follows per user.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed: the same seed and sizes give the same data.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per bulk insert.'
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username='user0').exists():
+            raise CommandError(
+                'The database already contains seeded data.'
+            )
+        store_seed_image()
+        start = perf_counter()
+        users, recipes = seed_data(
+            recipes=options['recipes'],
+            users=options['users'],
+            ingredients=options['ingredients'],
+            tags=options['tags'],
+            per_recipe=options['per_recipe'],
+            per_user=options['per_user'],
+            follows=options['follows'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            vary=True
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(recipes)} recipes, '
+            f'{RecipeIngredient.objects.count()} recipe ingredients, '
+            f'{Favorite.objects.count()} favorites and '
+            f'{Follow.objects.count()} follows in '
+            f'{perf_counter() - start:.1f} s.'
+        ))
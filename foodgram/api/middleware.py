@@ -0,0 +1,226 @@
+import json
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Списки параметров IN (%s, %s, ...) разной длины дают один отпечаток.
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+SPACES = re.compile(r'\s+')
+SELECT_LIST = re.compile(r'^SELECT (DISTINCT )?.*? FROM ')
+MAX_FINGERPRINT_LENGTH = 300
+LOGGED_DUPLICATES = 3
+
+_stats = {}
+_stats_lock = Lock()
+# QueryRecorder текущего запроса, если RequestTimingMiddleware включен.
+_recorder = ContextVar('request_timing_recorder', default=None)
+
+
+def fingerprint(sql):
+    """Текст запроса без различий в числе параметров и пробелах."""
+    return IN_LIST.sub('IN (...)', SPACES.sub(' ', sql.strip()))
+
+
+def short_sql(sql):
+    """Отпечаток для журнала: без списка выбираемых столбцов."""
+    return SELECT_LIST.sub(
+        r'SELECT \1... FROM ', sql, count=1
+    )[:MAX_FINGERPRINT_LENGTH]
+
+
+def view_stats():
+    """Накопленные по представлениям показатели, самые долгие первыми."""
+    with _stats_lock:
+        rows = [
+            {'view': view, **values} for view, values in _stats.items()
+        ]
+    for row in rows:
+        row['avg_ms'] = row['total_ms'] / row['count']
+        row['avg_queries'] = row['queries'] / row['count']
+        for key in (
+            'total_ms', 'max_ms', 'db_ms', 'serialize_ms',
+            'avg_ms', 'avg_queries'
+        ):
+            row[key] = round(row[key], 2)
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+def reset_view_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def record_view_stats(view, total, db, serialize, queries, duplicates,
+                      partial):
+    """
+    partial — ответ потоковый: запросы при его отдаче клиенту
+    выполняются после middleware и в показатели не попадают.
+    """
+    with _stats_lock:
+        values = _stats.setdefault(view, {
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'db_ms': 0.0,
+            'serialize_ms': 0.0,
+            'queries': 0,
+            'duplicates': 0,
+            'partial': 0,
+        })
+        values['count'] += 1
+        values['total_ms'] += total
+        values['max_ms'] = max(values['max_ms'], total)
+        values['db_ms'] += db
+        values['serialize_ms'] += serialize
+        values['queries'] += queries
+        values['duplicates'] += duplicates
+        values['partial'] += partial
+
+
+class QueryRecorder:
+    """Обертка выполнения запросов: время и отпечатки всех запросов."""
+
+    def __init__(self):
+        self.time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += perf_counter() - start
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def count(self):
+        return sum(self.fingerprints.values())
+
+    def duplicates(self):
+        """Повторявшиеся запросы: {отпечаток: число выполнений}."""
+        return {
+            sql: count for sql, count in self.fingerprints.most_common()
+            if count > 1
+        }
+
+
+class TimedSerializerMixin:
+    """
+    Учитывает в RequestTimingMiddleware время to_representation
+    сериализатора верхнего уровня за вычетом запросов к БД.
+    Вложенные сериализаторы входят во время внешнего.
+    """
+
+    def to_representation(self, instance):
+        recorder = _recorder.get()
+        if recorder is None or recorder.serializing:
+            return super().to_representation(instance)
+        recorder.serializing = True
+        start = perf_counter()
+        db_start = recorder.time
+        try:
+            return super().to_representation(instance)
+        finally:
+            recorder.serializing = False
+            recorder.serialize_time += (
+                perf_counter() - start - (recorder.time - db_start)
+            )
+
+
+class RequestTimingMiddleware:
+    """
+    Измеряет число и время запросов к БД, время представления,
+    сериализации и отрисовки ответа. Отдает их в заголовке
+    Server-Timing, пишет в журнал медленные запросы и копит показатели
+    по представлениям. Потоковые ответы отдаются клиенту уже после
+    middleware, их показатели помечаются как неполные.
+    Включается настройкой REQUEST_TIMING.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        total = (perf_counter() - start) * 1000
+        db = recorder.time * 1000
+        serialize = recorder.serialize_time * 1000
+        partial = response.streaming
+        render = (
+            getattr(request, 'render_finished', 0)
+            - getattr(request, 'render_started', 0)
+        ) * 1000
+        duplicates = recorder.duplicates()
+        duplicate_count = sum(duplicates.values()) - len(duplicates)
+        timings = [
+            f'db;dur={db:.1f};desc="{recorder.count} queries, '
+            f'{duplicate_count} duplicate"',
+            f'app;dur={max(total - db - serialize - render, 0):.1f}',
+            f'serialize;dur={serialize:.1f}',
+            f'render;dur={render:.1f}',
+            f'total;dur={total:.1f}',
+        ]
+        if partial:
+            timings.append('partial;desc="streaming body not measured"')
+        response['Server-Timing'] = ', '.join(timings)
+        match = request.resolver_match
+        view = f'{request.method} {match.view_name if match else "-"}'
+        record_view_stats(
+            view, total, db, serialize, recorder.count, duplicate_count,
+            partial
+        )
+        if (
+            total >= settings.REQUEST_TIMING_SLOW_MS
+            or recorder.count >= settings.REQUEST_TIMING_MAX_QUERIES
+        ):
+            logger.warning(json.dumps({
+                'view': view,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(total, 1),
+                'db_ms': round(db, 1),
+                'serialize_ms': round(serialize, 1),
+                'render_ms': round(render, 1),
+                'queries': recorder.count,
+                'partial': partial,
+                'duplicates': [
+                    {
+                        'count': count,
+                        'sql': short_sql(sql),
+                    }
+                    for sql, count in list(
+                        duplicates.items()
+                    )[:LOGGED_DUPLICATES]
+                ],
+            }, ensure_ascii=False))
+        return response
+
+    def process_template_response(self, request, response):
+        """Ответы DRF отрисовываются после представления."""
+        request.render_started = perf_counter()
+
+        def rendered(response):
+            request.render_finished = perf_counter()
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -1,4 +1,5 @@
 import base64
+import binascii
 
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
@@ -7,8 +8,17 @@ from djoser.serializers import (
     UserSerializer
 )
 from django.core.files.base import ContentFile
-
-from .utils.functions import check_unique_data
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .middleware import TimedSerializerMixin
+from .utils.functions import (
+    annotate_recipes,
+    check_unique_data,
+    get_objects,
+    get_subscriptions
+)
+from .utils.shopping_list import update_recipe_amounts
 from recipes.models import (
     Tag,
     Recipe,
@@ -19,45 +29,78 @@ from recipes.models import (
     Favorite,
     Follow
 )
-from recipes.constants import MIN_VALUE_FIELD_AMOUNT_COOKINGTIME
+from recipes.constants import (
+    MAX_BULK_RECIPES,
+    MAX_IMAGE_UPLOAD_SIZE,
+    MIN_VALUE_FIELD_AMOUNT_COOKINGTIME
+)
 
 
 class Base64ImageField(serializers.ImageField):
-    """Обработка изображения."""
+    """
+    Обработка изображения.
+    Здесь только проверяется и сохраняется исходный файл,
+    перекодирование выполняется в фоне (api.utils.images).
+    """
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            try:
+                format, imgstr = data.split(';base64,')
+            except ValueError:
+                raise ValidationError('Неверный формат изображения.')
+            if len(imgstr) * 3 // 4 > MAX_IMAGE_UPLOAD_SIZE:
+                raise ValidationError('Слишком большое изображение.')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                content = base64.b64decode(imgstr, validate=True)
+            except binascii.Error:
+                raise ValidationError('Неверный формат изображения.')
+            data = ContentFile(content, name='temp.' + ext)
         return super().to_internal_value(data)
 
 
-class FavoriteRecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор создания/удаления модели Favorite."""
+class ImageVariantsField(serializers.Field):
+    """
+    Уменьшенные копии изображения рецепта: {ширина: {формат: url}}.
+    Пустой словарь, пока копии для текущего изображения не готовы.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, recipe):
+        data = recipe.image_variants or {}
+        if data.get('source') != recipe.image.name:
+            return {}
+        request = self.context.get('request')
+        build_url = (
+            request.build_absolute_uri if request else lambda url: url
+        )
+        return {
+            width: {
+                extension: build_url(default_storage.url(name))
+                for extension, name in formats.items()
+            }
+            for width, formats in data.get('variants', {}).items()
+        }
+
+
+class FavoriteRecipeSerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
+    """
+    Сериализатор модели Favorite.
+    Уникальность пары user/recipe проверяет ограничение в базе данных,
+    сообщения об ошибках для него заданы здесь.
+    """
+    exists_message = 'Рецепт уже в избранном.'
+    missing_message = 'Рецепта нет в избранном.'
 
     class Meta:
         model = Favorite
         fields = ('user', 'recipe')
 
-    def validate(self, attrs):
-        if self.context.get('request').method == 'POST':
-            if Favorite.objects.filter(
-                recipe=attrs.get('recipe'),
-                user=attrs.get('user')
-            ).exists():
-                raise ValidationError(
-                    {'error': 'Рецепт уже в избранном.'}
-                )
-        else:
-            if not Favorite.objects.filter(
-                recipe=attrs.get('recipe'),
-                user=attrs.get('user')
-            ).exists():
-                raise ValidationError(
-                    {'error': 'Рецепта нет в избранном.'}
-                )
-        return attrs
-
     def to_representation(self, instance):
         return RecipeShortSerializer(
             instance.recipe,
@@ -66,56 +109,54 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
 
 
 class ShoppingCartSerizlizer(FavoriteRecipeSerializer):
-    """Сериализатор создания/удаления списка покупок."""
+    """Сериализатор модели списка покупок."""
+    exists_message = 'Рецепт уже в списке покупок.'
+    missing_message = 'Рецепт уже отсутствует в списке покупок.'
 
     class Meta(FavoriteRecipeSerializer.Meta):
         model = ShoppingCart
 
-    def validate(self, attrs):
-        if self.context.get('request').method == 'POST':
-            if ShoppingCart.objects.filter(
-                recipe=attrs.get('recipe'),
-                user=attrs.get('user')
-            ).exists():
-                raise ValidationError(
-                    {'error': 'Рецепт уже в списке покупок.'}
-                )
-        else:
-            if not ShoppingCart.objects.filter(
-                recipe=attrs.get('recipe'),
-                user=attrs.get('user')
-            ).exists():
-                raise ValidationError(
-                    {'error': 'Рецепт уже отсутствует в списке покупок.'}
-                )
-        return attrs
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES
+    )
+
+    def validate_recipes(self, data):
+        return check_unique_data(data)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для тэгов."""
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug', 'color',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для ингридиентов."""
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для модели favorite/shoppingcart.
     Только для чтения.
     """
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
         read_only_fields = fields
@@ -137,7 +178,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('amount', 'id', 'name', 'measurement_unit',)
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta(UserSerializer.Meta):
@@ -145,15 +186,10 @@ class CustomUserSerializer(UserSerializer):
         fields = ('is_subscribed',) + UserSerializer.Meta.fields
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and user != obj
-            and obj.following.filter(user=user).exists()
-        )
+        return obj.id in get_subscriptions(self.context)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для чтения рецептов."""
     tags = TagSerializer(many=True, read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -164,21 +200,14 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     author = CustomUserSerializer(read_only=True)
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.recipe.filter(user=user).exists()
-        )
+        return bool(getattr(obj, 'is_favorited', False))
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.shoppingcart.filter(user=user).exists()
-        )
+        return bool(getattr(obj, 'is_in_shopping_cart', False))
 
     class Meta:
         model = Recipe
@@ -191,16 +220,19 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
 
 class RecipeIndregientCreateSerializer(serializers.ModelSerializer):
-    """Сериализатор ингридиентов для создания рецептов."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    """
+    Сериализатор ингридиентов для создания рецептов.
+    Ингредиенты по id получает RecipeCreateUpdateSerializer
+    одним запросом на весь рецепт.
+    """
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
@@ -210,9 +242,8 @@ class RecipeIndregientCreateSerializer(serializers.ModelSerializer):
 class RecipeCreateUpdateSerializer(RecipeSerializer):
     """Сериализатор для создания, обновления рецепта."""
     ingredients = RecipeIndregientCreateSerializer(many=True, required=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
         required=True
     )
     image = Base64ImageField(required=True)
@@ -234,8 +265,15 @@ class RecipeCreateUpdateSerializer(RecipeSerializer):
             raise ValidationError({
                 'error': 'Добавьте минимум один ингредиент.'
             })
-        check_unique_data(data)
-        return data
+        check_unique_data(data, key=lambda item: item['id'])
+        ingredients = get_objects(
+            Ingredient,
+            [item['id'] for item in data],
+            'Ингредиенты не найдены: {}.'
+        )
+        return [
+            {**item, 'id': ingredients[item['id']]} for item in data
+        ]
 
     def validate_tags(self, data):
         if not data:
@@ -243,9 +281,12 @@ class RecipeCreateUpdateSerializer(RecipeSerializer):
                 'error': 'Добавьте минимум один тег.'
             })
         check_unique_data(data)
-        return data
+        tags = get_objects(Tag, data, 'Теги не найдены: {}.')
+        return [tags[pk] for pk in data]
 
     def validate(self, attrs):
+        if self.partial and 'cooking_time' not in attrs:
+            return attrs
         if not attrs.get('cooking_time'):
             raise ValidationError({
                 'error': 'Укажите время приготовления.'
@@ -267,16 +308,57 @@ class RecipeCreateUpdateSerializer(RecipeSerializer):
             ]
         )
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к ingredients, меняя только
+        отличающиеся строки: новые добавляются, у изменившихся
+        обновляется количество, лишние удаляются.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+        amounts = {
+            ingredient.get('id').id: ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        deltas = {}
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                deltas[ingredient_id] = amount
+            elif item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.create_update_recipe(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient.get('id').id not in current
+        ])
+        # bulk_update и bulk_create не шлют сигналов, поэтому списки
+        # покупок обновляются здесь; удаление учитывает сигнал pre_delete.
+        update_recipe_amounts(recipe.id, deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
         super().update(instance, validated_data)
-        instance.ingredients.clear()
-        self.create_update_recipe(instance, ingredients)
-        instance.tags.set(tags)
-        instance.save()
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        if tags is not None:
+            instance.tags.set(tags)
         return instance
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -289,13 +371,16 @@ class RecipeCreateUpdateSerializer(RecipeSerializer):
         return recipe
 
     def to_representation(self, instance):
+        instance = Recipe.objects.with_related().with_user_flags(
+            self.context.get('request').user
+        ).get(pk=instance.pk)
         return RecipeSerializer(
             instance,
             context=self.context
         ).data
 
 
-class CustomUserCreateSerializer(UserCreateSerializer):
+class CustomUserCreateSerializer(TimedSerializerMixin, UserCreateSerializer):
 
     class Meta:
         model = User
@@ -312,7 +397,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 class FollowingUserSerializer(CustomUserSerializer):
     """Сериализатор для подписок с рецептами."""
     recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta(CustomUserSerializer.Meta):
         model = User
@@ -322,29 +407,15 @@ class FollowingUserSerializer(CustomUserSerializer):
         ) + CustomUserSerializer.Meta.fields
         read_only_fields = fields
 
-    def get_recipes_limit(self):
-        limit = self.context.get('request').query_params.get('recipes_limit')
-        if limit:
-            try:
-                return int(limit)
-            except ValueError:
-                raise ValueError(
-                    {'error': 'Параметр recipes_limit должен содержать число.'}
-                )
-
     def get_recipes(self, obj):
-        limit = self.get_recipes_limit()
         return RecipeShortSerializer(
-            obj.recipes,
+            obj.limited_recipes,
             many=True,
             context=self.context
-        ).data[:limit]
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        ).data
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор создания модели Follow."""
 
     class Meta:
@@ -366,7 +437,11 @@ class FollowSerializer(serializers.ModelSerializer):
         return attrs
 
     def to_representation(self, instance):
+        author = annotate_recipes(
+            User.objects.filter(pk=instance.author_id),
+            self.context.get('recipes_limit')
+        ).get()
         return FollowingUserSerializer(
-            instance.author,
+            author,
             context=self.context
         ).data
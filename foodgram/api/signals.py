@@ -0,0 +1,276 @@
+from django.db.models import Model, QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+    User
+)
+from recipes.signals import rows_imported
+from .utils.counters import cascaded_rows, update_counters
+from .utils.images import schedule_image_processing
+from .utils.search import index_recipe, unindex_recipes
+from .utils.shopping_list import update_recipe_amounts, update_shopping_lists
+from .utils.tag_masks import remove_tag_bit, update_tag_masks
+from .utils.versions import (
+    bump_on_commit,
+    user_version,
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    USERS_VERSION
+)
+
+# Поля пользователя, которые попадают в ленту рецептов.
+USER_FEED_FIELDS = frozenset(
+    ('id', 'email', 'username', 'first_name', 'last_name')
+)
+
+
+@receiver((post_save, post_delete, rows_imported), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_on_commit(INGREDIENTS_VERSION, RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete, rows_imported), sender=Tag)
+def tag_changed(**kwargs):
+    bump_on_commit(TAGS_VERSION, RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(**kwargs):
+    bump_on_commit(RECIPES_VERSION)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    """Пересчет Recipe.tag_mask при изменении тегов рецептов."""
+    if action == 'pre_clear' and reverse:
+        instance.cleared_recipes = list(
+            instance.recipes.values_list('id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        update_tag_masks([instance.pk])
+    elif action == 'post_clear':
+        update_tag_masks(getattr(instance, 'cleared_recipes', ()))
+    else:
+        update_tag_masks(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(instance, **kwargs):
+    if instance.bit is not None:
+        remove_tag_bit(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, update_fields=None, **kwargs):
+    if update_fields is None or 'image' in update_fields:
+        schedule_image_processing(instance)
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        index_recipe(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(instance, origin=None, **kwargs):
+    if not is_batch(origin, Recipe) and not is_cascade(origin, Recipe):
+        unindex_recipes([instance.pk])
+    elif first_in_batch(origin, 'search_index'):
+        model, pks = deleted_objects(origin)
+        unindex_recipes(
+            Recipe.objects.filter(
+                author__in=pks
+            ).values_list('id', flat=True) if model is User else pks
+        )
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(update_fields=None, created=True, **kwargs):
+    if update_fields is None or USER_FEED_FIELDS & set(update_fields):
+        bump_on_commit(RECIPES_VERSION)
+    if created:
+        bump_on_commit(USERS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def user_lists_changed(instance, **kwargs):
+    bump_on_commit(user_version(instance.user_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def counted_row_saved(sender, instance, created, **kwargs):
+    if created:
+        update_counters(sender, [instance])
+
+
+@receiver(pre_delete, sender=Favorite)
+@receiver(pre_delete, sender=ShoppingCart)
+@receiver(pre_delete, sender=Follow)
+@receiver(pre_delete, sender=Recipe)
+def counted_row_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Счетчики уменьшаются только за строки, заблокированные до DELETE:
+    строки, которые успел удалить параллельный запрос, не найдутся.
+    """
+    if is_batch(origin, sender):
+        if first_in_batch(origin, 'counters'):
+            update_counters(sender, locked(origin), -1)
+    elif is_cascade(origin, sender):
+        if first_in_batch(origin, f'{sender._meta.model_name}_counters'):
+            deleted = deleted_objects(origin)
+            update_counters(
+                sender, cascaded_rows(sender, deleted), -1, deleted
+            )
+    else:
+        update_counters(
+            sender, locked(sender.objects.filter(pk=instance.pk)), -1
+        )
+
+
+def locked(queryset):
+    """Строки queryset, заблокированные до конца транзакции."""
+    return list(queryset.order_by().select_for_update(of=('self',)))
+
+
+def lock(queryset):
+    """
+    Блокирует строки queryset до конца транзакции и возвращает его:
+    строки, удаленные параллельным запросом, в нем уже не найдутся.
+    """
+    list(
+        queryset.order_by().select_for_update(
+            of=('self',)
+        ).values_list('pk', flat=True)
+    )
+    return queryset
+
+
+def is_batch(origin, model):
+    """Удаление запущено через QuerySet.delete() модели model."""
+    return isinstance(origin, QuerySet) and origin.model is model
+
+
+def is_cascade(origin, model):
+    """
+    Строки model удаляются каскадом вместе с объектами другой
+    модели, например рецепты и подписки вместе с пользователем.
+    """
+    if isinstance(origin, QuerySet):
+        return origin.model is not model
+    return isinstance(origin, Model) and not isinstance(origin, model)
+
+
+def deleted_objects(origin):
+    """Модель и id объектов, удаление которых вызвало сигнал."""
+    if isinstance(origin, QuerySet):
+        return origin.model, list(origin.values_list('pk', flat=True))
+    return type(origin), [origin.pk]
+
+
+def first_in_batch(origin, name='shopping_list'):
+    """
+    QuerySet.delete() шлет pre_delete для каждой удаляемой строки.
+    True только для первой из них, чтобы весь пакет учитывался
+    обработчиком name одним набором запросов.
+    """
+    flag = f'_{name}_updated'
+    if getattr(origin, flag, False):
+        return False
+    setattr(origin, flag, True)
+    return True
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(instance, created, **kwargs):
+    if created:
+        update_shopping_lists(ShoppingCart.objects.filter(pk=instance.pk))
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_deleted(instance, origin=None, **kwargs):
+    """
+    Из списков покупок вычитаются только строки корзины,
+    заблокированные до DELETE, как и в counted_row_deleted.
+    """
+    if is_batch(origin, ShoppingCart):
+        if first_in_batch(origin):
+            update_shopping_lists(lock(origin), -1)
+    elif is_cascade(origin, ShoppingCart):
+        if first_in_batch(origin):
+            model, pks = deleted_objects(origin)
+            carts = ShoppingCart.objects.filter(recipe__in=pks)
+            if model is User:
+                # Списки покупок удаляемых пользователей удаляются
+                # вместе с ними, меняются только списки остальных.
+                carts = ShoppingCart.objects.filter(
+                    recipe__author__in=pks
+                ).exclude(user__in=pks)
+            update_shopping_lists(lock(carts), -1)
+    else:
+        update_shopping_lists(
+            lock(ShoppingCart.objects.filter(pk=instance.pk)), -1
+        )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(instance, **kwargs):
+    instance.previous_amounts = dict(
+        RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount')
+    ) if not instance._state.adding else {}
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(instance, **kwargs):
+    amounts = {
+        pk: -amount
+        for pk, amount in getattr(instance, 'previous_amounts', {}).items()
+    }
+    amounts[instance.ingredient_id] = (
+        amounts.get(instance.ingredient_id, 0) + instance.amount
+    )
+    update_recipe_amounts(instance.recipe_id, amounts)
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(instance, origin=None, **kwargs):
+    """
+    Удаление рецепта убирает его из корзин, это учитывает
+    shopping_cart_deleted. Здесь учитывается удаление только
+    отдельных ингредиентов рецепта.
+    """
+    if isinstance(origin, RecipeIngredient):
+        update_recipe_amounts(
+            instance.recipe_id,
+            {instance.ingredient_id: -instance.amount}
+        )
+    elif is_batch(origin, RecipeIngredient) and first_in_batch(origin):
+        recipes = {}
+        for recipe_id, ingredient_id, amount in origin.values_list(
+            'recipe_id', 'ingredient_id', 'amount'
+        ):
+            recipes.setdefault(recipe_id, {})[ingredient_id] = -amount
+        for recipe_id, amounts in recipes.items():
+            update_recipe_amounts(recipe_id, amounts)
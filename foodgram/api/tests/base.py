@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Barrier
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.utils.seeding import store_seed_image, SEED_IMAGE
+from api.utils.versions import versions_cache, VERSIONS_CACHE
+from recipes.models import Recipe, RecipeIngredient, User
+
+PASSWORD = 'Test-password-1'
+THREADS = 8
+TEST_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        VERSIONS_CACHE: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': VERSIONS_CACHE,
+        },
+    },
+    'IMAGE_PROCESSING_WORKERS': 0,
+    'PASSWORD_HASHERS': (
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ),
+}
+
+
+class TemporaryMediaMixin:
+    """
+    Временный MEDIA_ROOT, кеш в памяти и быстрый хеш паролей
+    на время тестов класса.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        test_settings = override_settings(
+            MEDIA_ROOT=media_root, **TEST_SETTINGS
+        )
+        test_settings.enable()
+        cls.addClassCleanup(test_settings.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        versions_cache.clear()
+
+
+@contextmanager
+def rolled_back():
+    """Изменения в базе внутри блока откатываются."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def token_client(user=None):
+    """Клиент API, аутентифицированный токеном, как фронтенд."""
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def make_user(name, **fields):
+    return User.objects.create_user(
+        username=name,
+        email=f'{name}@example.com',
+        password=PASSWORD,
+        first_name='Имя',
+        last_name='Фамилия',
+        **fields
+    )
+
+
+def make_recipe(author, ingredients=(), tags=(), name='Рецепт'):
+    """Рецепт с изображением seed_data и ингредиентами по 10 единиц."""
+    # Обработка изображения удаляет исходный файл.
+    store_seed_image()
+    recipe = Recipe.objects.create(
+        name=name,
+        text='Описание',
+        cooking_time=10,
+        author=author,
+        image=SEED_IMAGE
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+        for ingredient in ingredients
+    )
+    recipe.tags.set(tags)
+    return recipe
+
+
+def add_rows(model, user, recipes):
+    """Добавляет рецепты в избранное или корзину с сигналами модели."""
+    for recipe in recipes:
+        model.objects.get_or_create(user=user, recipe=recipe)
+
+
+def concurrently(function):
+    """Вызывает function одновременно из THREADS потоков."""
+    barrier = Barrier(THREADS)
+
+    def call():
+        barrier.wait()
+        try:
+            return function()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        futures = [pool.submit(call) for _ in range(THREADS)]
+        return [future.result() for future in futures]
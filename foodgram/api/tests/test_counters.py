@@ -0,0 +1,65 @@
+from django.test import TestCase
+
+from api.tests.base import (
+    make_recipe,
+    make_user,
+    token_client,
+    TemporaryMediaMixin
+)
+from api.utils.images import process_image
+from recipes.models import Recipe, User
+
+
+class DenormalizedFieldsTest(TemporaryMediaMixin, TestCase):
+    """Сохранение устаревшего объекта не затирает счетчики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.reader = make_user('reader')
+        cls.recipe = make_recipe(cls.author)
+
+    def test_recipe_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        token_client(self.reader).post(
+            f'/api/recipes/{recipe.id}/favorite/'
+        )
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def stale_processed_recipe(self):
+        """Рецепт, загруженный до фоновой обработки изображения."""
+        recipe = Recipe.objects.get(pk=make_recipe(self.author).pk)
+        process_image(recipe.pk, recipe.image.name)
+        return recipe
+
+    def test_recipe_save_keeps_processed_image(self):
+        recipe = self.stale_processed_recipe()
+        processed = Recipe.objects.get(pk=recipe.pk)
+        self.assertNotEqual(processed.image.name, recipe.image.name)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, processed.image.name)
+        self.assertEqual(recipe.image_variants, processed.image_variants)
+
+    def test_recipe_save_writes_assigned_image(self):
+        recipe = self.stale_processed_recipe()
+        recipe.image = 'recipes/images/other.png'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, 'recipes/images/other.png')
+
+    def test_user_save_keeps_counters(self):
+        author = User.objects.get(pk=self.author.pk)
+        token_client(self.reader).post(
+            f'/api/users/{author.id}/subscribe/'
+        )
+        author.first_name = 'Новое имя'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Новое имя')
+        self.assertEqual(author.followers_count, 1)
@@ -0,0 +1,49 @@
+from django.test import TestCase
+
+from api.tests.base import TemporaryMediaMixin
+from api.utils.search import ingredient_index
+from recipes.models import Ingredient
+
+# Названия, порядок которых зависит от правил сравнения строк:
+# регистр, пробелы, дефисы, цифры и буква ё.
+NAMES = (
+    'сахар', 'сахар ванильный', 'сахар-песок', 'сахарная пудра',
+    'сахар2', 'ёжевика', 'ежевика', 'еж', 'Sugar', 'sugar cane',
+    'sugar-free', 'sugarcane', 'SUGAR syrup', 'salt', 'Salt flakes',
+)
+TERMS = (
+    (), ('сахар',), ('сахар ',), ('е',), ('ё',), ('sugar',),
+    ('SUGAR',), ('s', 'su'), ('sa',), ('нет',),
+)
+
+
+class IngredientIndexTest(TemporaryMediaMixin, TestCase):
+    """Поиск по индексу в памяти совпадает с запросом к базе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in NAMES
+        )
+
+    def test_matches_orm(self):
+        for terms in TERMS:
+            expected = Ingredient.objects.all()
+            for term in terms:
+                expected = expected.filter(name__istartswith=term)
+            with self.subTest(terms=terms):
+                self.assertEqual(
+                    ingredient_index.search(terms),
+                    list(expected.values('id', 'name', 'measurement_unit'))
+                )
+
+    def test_endpoint(self):
+        response = self.client.get('/api/ingredients/', {'name': 'sugar'})
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            list(
+                Ingredient.objects.filter(
+                    name__istartswith='sugar'
+                ).values_list('name', flat=True)
+            )
+        )
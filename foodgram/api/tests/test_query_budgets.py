@@ -0,0 +1,532 @@
+from itertools import count
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.serializers import RecipeCreateUpdateSerializer
+from api.tests.base import (
+    add_rows,
+    make_recipe,
+    make_user,
+    rolled_back,
+    token_client,
+    TemporaryMediaMixin,
+    PASSWORD
+)
+from api.urls import router
+from api.utils.caching import CachedResponseMixin
+from api.utils.seeding import image_data, seed_data
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    ShoppingCart,
+    Tag
+)
+
+# Большой вариант запроса: ингредиентов, рецептов, строк на странице.
+MANY = 20
+PAGE_SIZE = 50
+# Токен пользователя, которого создает before запроса на удаление.
+TEMPORARY_TOKEN = 'budget' + '0' * 34
+# Активация и сброс учетных данных по почте в проверки не входят.
+SKIPPED_ROUTES = {
+    'users-activation',
+    'users-resend-activation',
+    'users-reset-password',
+    'users-reset-password-confirm',
+    'users-reset-username',
+    'users-reset-username-confirm',
+}
+# Индекс FTS5 на SQLite обновляет приложение: удаление и вставка
+# строки при сохранении рецепта, удаление при удалении. В PostgreSQL
+# search_vector поддерживает триггер.
+INDEX, UNINDEX = (2, 1) if connection.vendor == 'sqlite' else (0, 0)
+numbers = count()
+
+
+class RequestCase:
+    """Вариант запроса к API: клиент, метод, путь и данные."""
+
+    def __init__(self, name, client, method, path=None, data=None,
+                 before=None):
+        self.name = name
+        self.client = client
+        self.method = method
+        self.path = path
+        self.data = data
+        self.before = before
+
+    def prepare(self):
+        """Готовит данные, возвращает путь запроса."""
+        path = self.before() if self.before else None
+        return path or self.path
+
+    def request(self, path):
+        response = getattr(self.client, self.method)(
+            path, self.data, format='json'
+        )
+        if response.streaming:
+            # Потоковый ответ читает базу при выдаче содержимого.
+            b''.join(response.streaming_content)
+        return response
+
+
+def user_with_rows(recipes, authors, rows=0):
+    """Пользователь с rows строками каждой связанной модели."""
+    user = make_user(f'budget{next(numbers)}')
+    for recipe in range(rows):
+        make_recipe(user, Ingredient.objects.all()[:3])
+    add_rows(Favorite, user, recipes[:rows])
+    add_rows(ShoppingCart, user, recipes[:rows])
+    for author in authors[:rows]:
+        Follow.objects.create(user=user, author=author)
+        Follow.objects.create(user=author, author=user)
+    return user
+
+
+class RecipeValidationQueriesTest(TemporaryMediaMixin, TestCase):
+    """Проверка данных рецепта не зависит от числа ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient {number}', measurement_unit='г')
+            for number in range(40)
+        )
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'tag {number}', slug=f'tag{number}', color='#FFFFFF')
+            for number in range(3)
+        )
+
+    def test_ingredients_and_tags_in_two_queries(self):
+        image = image_data()
+        for size in (1, 10, 40):
+            serializer = RecipeCreateUpdateSerializer(data={
+                'name': 'recipe',
+                'text': 'text',
+                'cooking_time': 10,
+                'image': image,
+                'tags': [tag.id for tag in self.tags],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 1}
+                    for ingredient in self.ingredients[:size]
+                ],
+            })
+            with self.subTest(size=size), self.assertNumQueries(2):
+                serializer.is_valid(raise_exception=True)
+
+
+class EndpointQueryBudgetTest(TemporaryMediaMixin, TestCase):
+    """
+    Каждый маршрут API выполняет одно и то же число запросов к БД
+    при любом числе строк в ответе или в данных запроса.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.recipes = seed_data(
+            recipes=60, users=10, ingredients=40, tags=6,
+            per_recipe=3, per_user=3, follows=2
+        )
+        cls.tags = list(Tag.objects.order_by('id'))
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.light_author = cls.make_user()
+        cls.light_recipe = cls.make_recipe(cls.light_author, 1)
+        cls.heavy_author = cls.make_user()
+        cls.heavy_recipe = cls.make_recipe(cls.heavy_author, MANY)
+        for recipe in range(MANY):
+            cls.make_recipe(cls.heavy_author, 3)
+        for user in cls.users:
+            add_rows(Favorite, user, (cls.heavy_recipe,))
+            add_rows(ShoppingCart, user, (cls.heavy_recipe,))
+        cls.light = cls.make_user()
+        Follow.objects.create(user=cls.light, author=cls.light_author)
+        add_rows(Favorite, cls.light, (cls.light_recipe,))
+        add_rows(ShoppingCart, cls.light, (cls.light_recipe,))
+        cls.heavy = cls.make_user(MANY)
+        for author in (cls.light_author, cls.heavy_author):
+            Follow.objects.create(user=cls.heavy, author=author)
+        add_rows(Favorite, cls.heavy, (cls.heavy_recipe,))
+        add_rows(ShoppingCart, cls.heavy, (cls.heavy_recipe,))
+        # Ингредиенты не пересекаются с данными обновления, тегов нет:
+        # оба варианта меняют одни и те же связи.
+        cls.own = make_recipe(cls.heavy, cls.ingredients[-3:], name='Свой')
+        # Избранное и корзину покупателя меняют before запросов.
+        cls.buyer = cls.make_user()
+
+    @classmethod
+    def make_recipe(cls, author, size):
+        return make_recipe(
+            author, cls.ingredients[:size], cls.tags[:size],
+            name=f'Рецепт {next(numbers)}'
+        )
+
+    @classmethod
+    def make_user(cls, rows=0):
+        return user_with_rows(cls.recipes, cls.users, rows)
+
+    def setUp(self):
+        super().setUp()
+        # Кеш ответов скрыл бы запросы повторного вызова.
+        patcher = mock.patch.object(CachedResponseMixin, 'cache_timeout', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clients = {
+            user: token_client(user)
+            for user in (self.light, self.heavy, self.buyer)
+        }
+
+    def assertQueryBudget(self, name, budget, cases):
+        """
+        Каждый вариант запроса выполняет ровно budget запросов к БД.
+        Считается второй вызов: первый заполняет кеши ContentType,
+        индекса ингредиентов и т.п. и откатывается, как и второй.
+        Колбэки on_commit выполняются и входят в бюджет.
+        Возвращает проверенные пары (маршрут, метод).
+        """
+        routes = set()
+        for case in cases:
+            with self.subTest(name, case=case.name), rolled_back():
+                path = case.prepare()
+                with rolled_back(), self.captureOnCommitCallbacks(
+                    execute=True
+                ):
+                    case.request(path)
+                with self.assertNumQueries(budget), \
+                        self.captureOnCommitCallbacks(execute=True):
+                    response = case.request(path)
+                self.assertLess(
+                    response.status_code, 400, getattr(response, 'data', None)
+                )
+                routes.add((
+                    response.resolver_match.url_name,
+                    response.wsgi_request.method.lower()
+                ))
+        return routes
+
+    def endpoint_checks(self):
+        """
+        Проверки маршрутов API: (название, бюджет, варианты запроса).
+        Варианты отличаются числом строк в ответе или в данных запроса.
+        """
+        light, heavy, buyer = self.light, self.heavy, self.buyer
+        light_recipe, heavy_recipe = self.light_recipe, self.heavy_recipe
+        tags, ingredients = self.tags, self.ingredients
+        clients = self.clients
+        anonymous = token_client()
+        temporary = APIClient()
+        temporary.credentials(HTTP_AUTHORIZATION=f'Token {TEMPORARY_TOKEN}')
+        others = self.recipes[:MANY]
+        image = image_data()
+
+        def recipe_data(size):
+            return {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 30,
+                'image': image,
+                'tags': [tag.id for tag in tags[:size]],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 100}
+                    for ingredient in ingredients[:size]
+                ],
+            }
+
+        def user_data(user):
+            return {
+                'email': user.email,
+                'username': user.username,
+                'first_name': 'Новое имя',
+                'last_name': 'Новая фамилия',
+            }
+
+        def temporary_user(rows, path):
+            def before():
+                user = self.make_user(rows)
+                Token.objects.create(user=user, key=TEMPORARY_TOKEN)
+                return path.format(user.id)
+            return before
+
+        def deleted_recipe(size, related):
+            def before():
+                recipe = self.make_recipe(heavy, size)
+                for user in related:
+                    add_rows(Favorite, user, (recipe,))
+                    add_rows(ShoppingCart, user, (recipe,))
+                return f'/api/recipes/{recipe.id}/'
+            return before
+
+        def added(model, rows):
+            def before():
+                add_rows(model, buyer, rows)
+            return before
+
+        def followed(author):
+            def before():
+                Follow.objects.create(user=buyer, author=author)
+            return before
+
+        def request(method, path, data=None):
+            """Варианты запроса от имени light и heavy."""
+            return [
+                RequestCase(
+                    user.username, clients[user], method,
+                    path.format(user=user.id),
+                    data(user) if callable(data) else data
+                )
+                for user in (light, heavy)
+            ]
+
+        def item(method, path, model, present):
+            """Варианты запроса к одному рецепту: light и heavy."""
+            return [
+                RequestCase(
+                    recipe.name, clients[buyer], method,
+                    path.format(recipe.id), None,
+                    added(model, (recipe,)) if present else None
+                )
+                for recipe in (light_recipe, heavy_recipe)
+            ]
+
+        def bulk(method, path, model, present):
+            """Варианты пакетного запроса: 1 и MANY рецептов."""
+            return [
+                RequestCase(
+                    f'{size} recipes', clients[buyer], method, path,
+                    {'recipes': [recipe.id for recipe in others[:size]]},
+                    added(model, others[:size]) if present else None
+                )
+                for size in (1, MANY)
+            ]
+
+        def pages(client, path):
+            """Варианты списка: одна строка и PAGE_SIZE строк."""
+            separator = '&' if '?' in path else '?'
+            return [
+                RequestCase(
+                    f'limit={limit}', client, 'get',
+                    f'{path}{separator}limit={limit}'
+                )
+                for limit in (1, PAGE_SIZE)
+            ]
+
+        def credentials_change(path, field, value):
+            return [
+                RequestCase(
+                    user.username, clients[user], 'post', path,
+                    {field: value.format(user.id),
+                     'current_password': PASSWORD}
+                )
+                for user in (light, heavy)
+            ]
+
+        def user_delete(path):
+            return [
+                RequestCase(
+                    f'{rows} rows', temporary, 'delete',
+                    data={'current_password': PASSWORD},
+                    before=temporary_user(rows, path)
+                )
+                for rows in (1, MANY)
+            ]
+
+        user_client = clients[heavy]
+        return (
+            ('api root', 1, [RequestCase('', user_client, 'get', '/api/')]),
+            ('users list', 3, pages(user_client, '/api/users/')),
+            ('users list, anonymous', 1, pages(anonymous, '/api/users/')),
+            ('user create', 5, [
+                RequestCase(
+                    '', anonymous, 'post', '/api/users/',
+                    {'email': 'new@example.com', 'username': 'new',
+                     'first_name': 'Имя', 'last_name': 'Фамилия',
+                     'password': PASSWORD}
+                )
+            ]),
+            ('user detail', 3, [
+                RequestCase(
+                    author.username, user_client, 'get',
+                    f'/api/users/{author.id}/'
+                )
+                for author in (self.light_author, self.heavy_author)
+            ]),
+            ('user update', 5, request(
+                'put', '/api/users/{user}/', user_data
+            )),
+            ('user partial update', 4, request(
+                'patch', '/api/users/{user}/', {'first_name': 'Имя'}
+            )),
+            ('user delete', 34 + UNINDEX, user_delete('/api/users/{}/')),
+            ('current user', 2, request('get', '/api/users/me/')),
+            ('current user update', 4, request(
+                'put', '/api/users/me/', user_data
+            )),
+            ('current user partial update', 3, request(
+                'patch', '/api/users/me/', {'first_name': 'Имя'}
+            )),
+            ('current user delete', 33 + UNINDEX, user_delete(
+                '/api/users/me/'
+            )),
+            ('set password', 2, credentials_change(
+                '/api/users/set_password/', 'new_password',
+                'Another-password-2'
+            )),
+            ('set email', 3, credentials_change(
+                '/api/users/set_email/', 'new_email',
+                'changed{}@example.com'
+            )),
+            ('subscriptions', 4, [
+                RequestCase(
+                    'light', clients[light], 'get',
+                    '/api/users/subscriptions/?limit=1&recipes_limit=1'
+                ),
+                RequestCase(
+                    'heavy', user_client, 'get',
+                    f'/api/users/subscriptions/?limit={PAGE_SIZE}'
+                ),
+            ]),
+            ('subscribe', 11, [
+                RequestCase(
+                    author.username, clients[buyer], 'post',
+                    f'/api/users/{author.id}/subscribe/'
+                )
+                for author in (self.light_author, self.heavy_author)
+            ]),
+            ('unsubscribe', 5, [
+                RequestCase(
+                    author.username, clients[buyer], 'delete',
+                    f'/api/users/{author.id}/subscribe/',
+                    before=followed(author)
+                )
+                for author in (self.light_author, self.heavy_author)
+            ]),
+            ('tags list', 1, [
+                RequestCase('', anonymous, 'get', '/api/tags/')
+            ]),
+            ('tag detail', 1, [
+                RequestCase(
+                    tag.slug, anonymous, 'get', f'/api/tags/{tag.slug}/'
+                )
+                for tag in (tags[0], tags[-1])
+            ]),
+            ('ingredients list', 0, [
+                RequestCase('', anonymous, 'get', '/api/ingredients/'),
+                RequestCase(
+                    'name', anonymous, 'get',
+                    '/api/ingredients/?name=%D0%B8%D0%BD%D0%B3'
+                ),
+            ]),
+            ('ingredient detail', 1, [
+                RequestCase(
+                    ingredient.name, anonymous, 'get',
+                    f'/api/ingredients/{ingredient.id}/'
+                )
+                for ingredient in (ingredients[0], ingredients[-1])
+            ]),
+            ('recipes, anonymous', 3, pages(anonymous, '/api/recipes/')),
+            ('recipes', 5, pages(user_client, '/api/recipes/')),
+            ('recipes by tags and author', 7, pages(
+                user_client,
+                f'/api/recipes/?tags={tags[0].slug}&tags={tags[1].slug}'
+                f'&author={self.heavy_author.id}'
+            )),
+            ('favorite recipes', 5, pages(
+                user_client, '/api/recipes/?is_favorited=1'
+            )),
+            ('recipes in cart', 5, pages(
+                user_client, '/api/recipes/?is_in_shopping_cart=1'
+            )),
+            ('recipe detail', 5, [
+                RequestCase(
+                    recipe.name, user_client, 'get',
+                    f'/api/recipes/{recipe.id}/'
+                )
+                for recipe in (light_recipe, heavy_recipe)
+            ]),
+            ('recipe create', 19 + INDEX, [
+                RequestCase(
+                    f'{size} ingredients', user_client, 'post',
+                    '/api/recipes/', recipe_data(size)
+                )
+                for size in (1, MANY)
+            ]),
+            ('recipe update', 29 + INDEX, [
+                RequestCase(
+                    f'{size} ingredients', user_client, 'put',
+                    f'/api/recipes/{self.own.id}/', recipe_data(size)
+                )
+                for size in (1, MANY)
+            ]),
+            ('recipe partial update', 29 + INDEX, [
+                RequestCase(
+                    f'{size} ingredients', user_client, 'patch',
+                    f'/api/recipes/{self.own.id}/', recipe_data(size)
+                )
+                for size in (1, MANY)
+            ]),
+            ('recipe delete', 17 + UNINDEX, [
+                RequestCase(
+                    'light', user_client, 'delete',
+                    before=deleted_recipe(1, (light,))
+                ),
+                RequestCase(
+                    'heavy', user_client, 'delete',
+                    before=deleted_recipe(MANY, self.users + [light])
+                ),
+            ]),
+            ('favorite add', 6, item(
+                'post', '/api/recipes/{}/favorite/', Favorite, False
+            )),
+            ('favorite remove', 3, item(
+                'delete', '/api/recipes/{}/favorite/', Favorite, True
+            )),
+            ('cart add', 10, item(
+                'post', '/api/recipes/{}/shopping_cart/', ShoppingCart, False
+            )),
+            ('cart remove', 6, item(
+                'delete', '/api/recipes/{}/shopping_cart/', ShoppingCart, True
+            )),
+            ('favorite bulk add', 7, bulk(
+                'post', '/api/recipes/favorite/', Favorite, False
+            )),
+            ('favorite bulk remove', 5, bulk(
+                'delete', '/api/recipes/favorite/', Favorite, True
+            )),
+            ('cart bulk add', 11, bulk(
+                'post', '/api/recipes/shopping_cart/', ShoppingCart, False
+            )),
+            ('cart bulk remove', 8, bulk(
+                'delete', '/api/recipes/shopping_cart/', ShoppingCart, True
+            )),
+            ('clear cart', 6, [
+                RequestCase(
+                    f'{len(rows)} recipes', clients[buyer], 'delete',
+                    '/api/recipes/clear_shopping_cart/',
+                    before=added(ShoppingCart, rows)
+                )
+                for rows in (others[:1], others)
+            ]),
+            ('download shopping list', 2, request(
+                'get', '/api/recipes/download_shopping_cart/'
+            )),
+        )
+
+    def test_endpoints_within_budget(self):
+        routes = set()
+        for name, budget, cases in self.endpoint_checks():
+            routes |= self.assertQueryBudget(name, budget, cases)
+        expected = {
+            (pattern.name, method)
+            for pattern in router.urls
+            if pattern.name not in SKIPPED_ROUTES
+            for method in getattr(pattern.callback, 'actions', {'get': None})
+            # HEAD обрабатывает тот же код, что и GET.
+            if method != 'head'
+        }
+        self.assertEqual(
+            sorted(expected - routes), [], 'маршруты без проверки'
+        )
@@ -0,0 +1,83 @@
+from django.test import TestCase
+
+from api.tests.base import (
+    make_recipe,
+    make_user,
+    token_client,
+    TemporaryMediaMixin
+)
+from api.utils.search import rebuild_search_index
+from recipes.models import Recipe
+
+# Рецепты: (название, описание, сколько таких). Одинаковые рецепты
+# получают одинаковый search_rank, и курсор проходит через равные ключи.
+RECIPES = (
+    ('Борщ', 'Описание', 4),
+    ('Суп', 'Борщ, почти борщ', 3),
+    ('Борщ летний', 'Борщ на бульоне', 2),
+    ('Каша', 'Описание', 2),
+)
+QUERY = 'борщ'
+
+
+class RecipeSearchTest(TemporaryMediaMixin, TestCase):
+    """Ранжированный поиск рецептов и постраничный вывод по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        for name, text, number in RECIPES:
+            for _ in range(number):
+                recipe = make_recipe(author, name=name)
+                Recipe.objects.filter(pk=recipe.pk).update(text=text)
+        rebuild_search_index()
+
+    def setUp(self):
+        super().setUp()
+        self.client = token_client(make_user('reader'))
+
+    def search(self, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': QUERY, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_and_rank(self):
+        results = self.search(limit=100)['results']
+        self.assertCountEqual(
+            [recipe['id'] for recipe in results],
+            Recipe.objects.exclude(name='Каша').values_list('id', flat=True)
+        )
+        # Слово в названии весит больше слова в описании.
+        self.assertEqual(
+            [recipe['name'] == 'Суп' for recipe in results],
+            [False] * 6 + [True] * 3
+        )
+
+    def test_cursor_pages(self):
+        expected = [
+            recipe['id'] for recipe in self.search(limit=100)['results']
+        ]
+        for limit in (1, 2, 4):
+            ids = []
+            page = self.search(limit=limit, cursor='')
+            # Зацикленный курсор дал бы больше страниц, чем рецептов.
+            for _ in expected:
+                ids += [recipe['id'] for recipe in page['results']]
+                if page['next'] is None:
+                    break
+                response = self.client.get(page['next'])
+                self.assertEqual(response.status_code, 200)
+                page = response.json()
+            with self.subTest(limit=limit):
+                self.assertEqual(ids, expected)
+
+    def test_index_follows_updates(self):
+        recipe = Recipe.objects.filter(name='Каша').first()
+        recipe.name = 'Борщ из каши'
+        recipe.save()
+        self.assertIn(
+            recipe.pk,
+            [item['id'] for item in self.search(limit=100)['results']]
+        )
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from api.middleware import reset_view_stats, view_stats
+from api.serializers import TagSerializer
+from api.tests.base import (
+    make_recipe,
+    make_user,
+    token_client,
+    TemporaryMediaMixin
+)
+from recipes.models import Ingredient, ShoppingCart, Tag
+
+
+@override_settings(
+    MIDDLEWARE=['api.middleware.RequestTimingMiddleware', *settings.MIDDLEWARE]
+)
+class RequestTimingTest(TemporaryMediaMixin, TestCase):
+    """Показатели RequestTimingMiddleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('user')
+        tag = Tag.objects.create(name='Тег', slug='tag', color='#FFFFFF')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        for number in range(3):
+            recipe = make_recipe(
+                cls.user, [ingredient], [tag], name=f'Рецепт {number}'
+            )
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        super().setUp()
+        reset_view_stats()
+        self.client = token_client(self.user)
+
+    def stats(self, view):
+        return next(row for row in view_stats() if row['view'] == view)
+
+    def test_serializer_time(self):
+        response = self.client.get('/api/recipes/')
+        timing = response['Server-Timing']
+        self.assertIn('serialize;dur=', timing)
+        self.assertNotIn('partial', timing)
+        stats = self.stats('GET api:recipes-list')
+        self.assertGreater(stats['serialize_ms'], 0)
+        self.assertEqual(stats['partial'], 0)
+
+    def test_streaming_response_is_partial(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        b''.join(response.streaming_content)
+        self.assertIn('partial;', response['Server-Timing'])
+        stats = self.stats('GET api:recipes-download-shopping-cart')
+        self.assertEqual(stats['partial'], 1)
+
+    def test_serializer_outside_request(self):
+        self.assertEqual(
+            TagSerializer(Tag.objects.get()).data['slug'], 'tag'
+        )
@@ -0,0 +1,91 @@
+from itertools import count
+
+from django.test import TestCase, TransactionTestCase
+
+from api.tests.base import (
+    concurrently,
+    make_recipe,
+    make_user,
+    token_client,
+    TemporaryMediaMixin,
+    THREADS
+)
+from recipes.constants import MAX_TAG_BITS
+from recipes.models import Recipe, Tag
+
+# Теги рецептов: номера в списке тегов, последние два без бита.
+RECIPE_TAGS = (
+    (0,),
+    (MAX_TAG_BITS,),
+    (0, MAX_TAG_BITS),
+    (1, MAX_TAG_BITS + 1),
+    (0, 1, MAX_TAG_BITS, MAX_TAG_BITS + 1),
+    (),
+)
+FILTERS = (
+    (0,),
+    (MAX_TAG_BITS,),
+    (0, MAX_TAG_BITS),
+    (1, MAX_TAG_BITS + 1),
+    (MAX_TAG_BITS, MAX_TAG_BITS + 1),
+)
+
+
+def create_tag(number):
+    return Tag.objects.create(
+        name=f'Тег {number}', slug=f'tag{number}', color='#FFFFFF'
+    )
+
+
+class TagMaskTest(TemporaryMediaMixin, TestCase):
+    """Теги сверх числа битов маски фильтруются по связям рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [create_tag(number) for number in range(MAX_TAG_BITS + 2)]
+        author = make_user('author')
+        for number, tags in enumerate(RECIPE_TAGS):
+            make_recipe(
+                author,
+                tags=[cls.tags[index] for index in tags],
+                name=f'Рецепт {number}'
+            )
+
+    def test_bits(self):
+        bits = [tag.bit for tag in self.tags]
+        self.assertCountEqual(bits[:MAX_TAG_BITS], range(MAX_TAG_BITS))
+        self.assertEqual(bits[MAX_TAG_BITS:], [None, None])
+        self.assertEqual(self.tags[MAX_TAG_BITS].mask, 0)
+
+    def test_filter_matches_relations(self):
+        client = token_client()
+        for indexes in FILTERS:
+            tags = [self.tags[index] for index in indexes]
+            expected = {
+                'any': Recipe.objects.filter(tags__in=tags),
+                'all': Recipe.objects.all(),
+            }
+            for tag in tags:
+                expected['all'] = expected['all'].filter(tags=tag)
+            for mode, recipes in expected.items():
+                with self.subTest(tags=indexes, mode=mode):
+                    response = client.get('/api/recipes/', {
+                        'tags': [tag.slug for tag in tags],
+                        'tags_mode': mode,
+                    })
+                    results = response.json()['results']
+                    self.assertCountEqual(
+                        [recipe['id'] for recipe in results],
+                        set(recipes.values_list('id', flat=True))
+                    )
+
+
+class TagBitConcurrencyTest(TransactionTestCase):
+    """Одновременно созданные теги получают разные биты."""
+
+    def test_concurrent_creation(self):
+        numbers = count()
+        concurrently(lambda: create_tag(next(numbers)))
+        bits = list(Tag.objects.values_list('bit', flat=True))
+        self.assertEqual(len(bits), THREADS)
+        self.assertCountEqual(bits, range(THREADS))
@@ -0,0 +1,121 @@
+from collections import Counter
+
+from django.test import skipUnlessDBFeature, TransactionTestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.tests.base import (
+    add_rows,
+    concurrently,
+    make_recipe,
+    make_user,
+    TemporaryMediaMixin,
+    THREADS
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    ShoppingCart,
+    ShoppingListItem
+)
+
+
+class ToggleConcurrencyTest(TemporaryMediaMixin, TransactionTestCase):
+    """
+    Одновременные запросы на добавление или удаление одного рецепта
+    в избранное и корзину: ровно один запрос меняет данные, остальные
+    получают 400, а счетчики и список покупок меняются один раз.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('user')
+        ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        self.recipe = make_recipe(self.user, (ingredient,))
+        # Строки другого пользователя и второй рецепт корзины с тем же
+        # ингредиентом: двойное вычитание не скроется за нулем.
+        other = make_user('other')
+        add_rows(Favorite, other, (self.recipe,))
+        add_rows(ShoppingCart, other, (self.recipe,))
+        add_rows(
+            ShoppingCart, self.user, (make_recipe(other, (ingredient,)),)
+        )
+
+    def hammer(self, method, url):
+        """Отправляет THREADS одинаковых запросов одновременно."""
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return getattr(client, method)(url).status_code
+
+        return Counter(concurrently(request))
+
+    def assertToggled(self, method, url, success):
+        self.assertEqual(
+            self.hammer(method, url),
+            Counter({success: 1, status.HTTP_400_BAD_REQUEST: THREADS - 1})
+        )
+
+    def amount(self):
+        return ShoppingListItem.objects.get(user=self.user).amount
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        rows = Favorite.objects.filter(user=self.user, recipe=self.recipe)
+        self.assertToggled('post', url, status.HTTP_201_CREATED)
+        self.assertEqual(rows.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 2)
+        self.assertToggled('delete', url, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(rows.count(), 0)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        rows = ShoppingCart.objects.filter(
+            user=self.user, recipe=self.recipe
+        )
+        self.assertToggled('post', url, status.HTTP_201_CREATED)
+        self.assertEqual(rows.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 2)
+        self.assertEqual(self.amount(), 20)
+        self.assertToggled('delete', url, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(rows.count(), 0)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.amount(), 10)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ModelDeleteConcurrencyTest(ToggleConcurrencyTest):
+    """
+    Одновременное удаление одних и тех же строк через ORM, как в админке:
+    счетчики и список покупок учитывают строки один раз. SQLite
+    выполняет записи по очереди, блокировки строк есть не везде.
+    """
+
+    def test_favorite(self):
+        add_rows(Favorite, self.user, (self.recipe,))
+        concurrently(
+            lambda: Favorite.objects.filter(
+                user=self.user, recipe=self.recipe
+            ).delete()
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_shopping_cart(self):
+        add_rows(ShoppingCart, self.user, (self.recipe,))
+        # Каждый поток удаляет свою копию загруженного объекта.
+        rows = [
+            ShoppingCart.objects.get(user=self.user, recipe=self.recipe)
+            for _ in range(THREADS)
+        ]
+        concurrently(lambda: rows.pop().delete())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.amount(), 10)
@@ -0,0 +1,22 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from api.tests.base import TEST_SETTINGS
+from api.utils.versions import get_version, RECIPES_VERSION
+
+MAX_ENTRIES = 10
+
+
+@override_settings(CACHES={
+    alias: {**options, 'OPTIONS': {'MAX_ENTRIES': MAX_ENTRIES}}
+    for alias, options in TEST_SETTINGS['CACHES'].items()
+})
+class VersionsCacheTest(SimpleTestCase):
+    """Переполнение кеша ответов не вытесняет версии данных."""
+
+    def test_versions_survive_response_culling(self):
+        version = get_version(RECIPES_VERSION)
+        for number in range(MAX_ENTRIES * 5):
+            cache.set(f'response:{number}', number)
+        self.assertEqual(get_version(RECIPES_VERSION), version)
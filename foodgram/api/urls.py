@@ -1,11 +1,13 @@
 from rest_framework import routers
+from django.conf import settings
 from django.urls import path, include
 
 from api.views import (
     CustomUserViewSet,
     TagViewSet,
     RecipeViewSet,
-    IngredientViewSet
+    IngredientViewSet,
+    RequestTimingView
 )
 
 
@@ -20,3 +22,8 @@ app_name = 'api'
 urlpatterns = [
     path('', include(router.urls))
 ]
+
+if settings.REQUEST_TIMING:
+    urlpatterns.insert(0, path(
+        'timing/', RequestTimingView.as_view(), name='timing'
+    ))
@@ -0,0 +1,82 @@
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from recipes.constants import RESPONSE_CACHE_TIMEOUT
+from .versions import get_versions
+
+
+class CachedResponseMixin:
+    """
+    Кеширует отрендеренные ответы list/retrieve под версиями данных
+    из cache_versions и отдает их со строгим ETag.
+    Версии меняются сигналами при изменении моделей, поэтому
+    устаревшие ответы больше не читаются и вытесняются из кеша.
+    """
+    cache_versions = ()
+    cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def get_cache_versions(self, request):
+        """Наборы данных, от которых зависит ответ."""
+        return self.cache_versions
+
+    def get_cache_params(self, request):
+        """Параметры запроса, от которых зависит ответ."""
+        return sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+        )
+
+    def get_response_cache_key(self, request):
+        versions = get_versions(self.get_cache_versions(request))
+        params = urlencode(self.get_cache_params(request), doseq=True)
+        return 'response:{}:{}:{}?{}'.format(
+            versions,
+            request.accepted_media_type,
+            request.build_absolute_uri(request.path),
+            params
+        )
+
+    def is_response_cacheable(self, request):
+        return request.accepted_renderer.format != 'api'
+
+    def render_response(self, request, response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        content = response.render().content
+        return (
+            content,
+            response['Content-Type'],
+            quote_etag(md5(content).hexdigest())
+        )
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not self.is_response_cacheable(request):
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = self.render_response(request, response)
+            cache.set(key, cached, self.cache_timeout)
+        content, content_type, etag = cached
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
@@ -0,0 +1,97 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+
+# Для каждой модели: внешний ключ строки и счетчик связанного объекта.
+COUNTERS = {
+    Favorite: (('recipe', 'favorites_count'),),
+    ShoppingCart: (('recipe', 'in_carts_count'),),
+    Follow: (('author', 'followers_count'), ('user', 'following_count')),
+    Recipe: (('author', 'recipes_count'),),
+}
+
+
+def update_counters(model, rows, sign=1, deleted=None):
+    """
+    Меняет счетчики объектов, на которые ссылаются строки rows модели
+    model, на sign за каждую строку: UPDATE с F() на каждую величину
+    изменения, без чтения счетчиков. Счетчики удаляемых объектов
+    deleted (модель и id) не обновляются.
+    """
+    for field, counter in COUNTERS[model]:
+        related = model._meta.get_field(field).related_model
+        skipped = set(deleted[1]) if deleted and deleted[0] is related else ()
+        groups = defaultdict(list)
+        for pk, total in Counter(
+            getattr(row, f'{field}_id') for row in rows
+        ).items():
+            if pk not in skipped:
+                groups[total].append(pk)
+        for total, pks in groups.items():
+            related.objects.filter(pk__in=pks).update(**{
+                counter: Greatest(F(counter) + sign * total, Value(0))
+            })
+
+
+def cascaded_rows(model, deleted):
+    """
+    Строки model, удаляемые каскадом вместе с объектами deleted
+    (модель и id): ссылающиеся на них внешними ключами. Строки
+    блокируются до конца транзакции.
+    """
+    related, pks = deleted
+    fields = [
+        field.name for field in model._meta.fields
+        if field.many_to_one and field.related_model is related
+    ]
+    if fields == [field for field, _ in COUNTERS[model]]:
+        # Строки выбраны по тому же ключу, что и единственный
+        # счетчик: он принадлежит удаляемым объектам.
+        return []
+    query = Q()
+    for field in fields:
+        query |= Q(**{f'{field}__in': pks})
+    if not query:
+        return []
+    # Строки, удаленные параллельным запросом, не учитываются дважды.
+    return list(
+        model.objects.filter(query).select_for_update(of=('self',))
+    )
+
+
+def actual_count(model, field):
+    """Подзапрос: число строк model, ссылающихся на внешний объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def recount(check=False):
+    """
+    Сверяет счетчики с данными и исправляет расхождения.
+    Возвращает {название счетчика: число неверных строк}.
+    """
+    result = {}
+    for model, counters in COUNTERS.items():
+        for field, counter in counters:
+            related = model._meta.get_field(field).related_model
+            wrong = related.objects.alias(
+                actual=actual_count(model, field)
+            ).exclude(**{counter: F('actual')})
+            name = f'{related._meta.model_name}.{counter}'
+            result[name] = wrong.count()
+            if result[name] and not check:
+                related.objects.filter(
+                    pk__in=wrong.values('pk')
+                ).update(**{counter: actual_count(model, field)})
+    return result
@@ -1,13 +1,127 @@
+from django.db import connections, transaction
+from django.db.models import Prefetch
 from rest_framework.validators import ValidationError
 
+from recipes.models import Recipe, ShoppingCart
+from .counters import COUNTERS, update_counters
+from .shopping_list import subtract_deleted_carts
+from .versions import bump_on_commit, user_version
 
-def check_unique_data(data):
+
+def check_unique_data(data, key=None):
     """Проверка данных (tags/ingredients) на уникальность."""
-    unique_data = []
-    for item in data:
-        if item in unique_data:
-            raise ValidationError({
-                'error': 'Данные должно быть уникальны.'
-            })
-        unique_data.append(item)
+    values = [key(item) if key else item for item in data]
+    if len(set(values)) != len(values):
+        raise ValidationError({
+            'error': 'Данные должно быть уникальны.'
+        })
     return data
+
+
+def get_objects(model, ids, message):
+    """
+    Получает объекты model по списку ids одним запросом.
+    Если каких-то объектов нет, перечисляет все отсутствующие id
+    в одной ошибке.
+    """
+    objects = model.objects.in_bulk(ids)
+    missing = [str(pk) for pk in ids if pk not in objects]
+    if missing:
+        raise ValidationError({
+            'error': message.format(', '.join(missing))
+        })
+    return objects
+
+
+def get_subscriptions(context):
+    """
+    Возвращает множество id авторов, на которых подписан
+    пользователь запроса. Загружается один раз и хранится в контексте,
+    общем для всех вложенных сериализаторов.
+    """
+    if 'subscriptions' not in context:
+        user = context.get('request').user
+        context['subscriptions'] = (
+            set(user.follower.values_list('author_id', flat=True))
+            if user.is_authenticated else set()
+        )
+    return context['subscriptions']
+
+
+def get_recipes_limit(request):
+    """Проверка и получение параметра recipes_limit."""
+    limit = request.query_params.get('recipes_limit')
+    if not limit:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise ValidationError({
+            'error': 'Параметр recipes_limit должен содержать '
+                     'неотрицательное число.'
+        })
+    return limit
+
+
+def annotate_recipes(queryset, limit=None):
+    """
+    Добавляет к авторам первые limit рецептов (limited_recipes),
+    выбранные одним запросом на всю страницу. Число рецептов
+    хранится в User.recipes_count.
+    """
+    recipes = Recipe.objects.all()
+    if limit is not None:
+        recipes = recipes[:limit]
+    return queryset.prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+    )
+
+
+def delete_returning(queryset, *fields):
+    """
+    Удаляет строки queryset одним запросом DELETE ... RETURNING
+    без сигналов и каскадов. Возвращает удаленные строки объектами
+    модели с полями fields.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(field) for field in fields]
+    query, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(model._meta.pk.column)} IN ({query}) '
+            'RETURNING '
+            + ', '.join(quote(field.column) for field in fields),
+            params
+        )
+        return [
+            model(**{
+                field.attname: value for field, value in zip(fields, row)
+            })
+            for row in cursor.fetchall()
+        ]
+
+
+def delete_user_rows(queryset):
+    """
+    Удаляет строки избранного, корзины или подписок queryset и учитывает
+    в счетчиках, списках покупок и версиях кеша только строки, которые
+    удалил этот запрос. DELETE идет первым в транзакции: параллельное
+    удаление тех же строк в PostgreSQL ждет его и ничего не находит,
+    а в SQLite блокировка чтения не повышается до записи.
+    Возвращает удаленные строки.
+    """
+    model = queryset.model
+    fields = {'id', 'user'} | {field for field, _ in COUNTERS[model]}
+    with transaction.atomic(savepoint=False):
+        rows = delete_returning(queryset, *fields)
+        if rows:
+            update_counters(model, rows, -1)
+            if model is ShoppingCart:
+                subtract_deleted_carts(rows)
+            bump_on_commit(*{user_version(row.user_id) for row in rows})
+    return rows
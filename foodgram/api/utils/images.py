@@ -0,0 +1,178 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.constants import (
+    IMAGE_QUALITY,
+    IMAGE_VARIANT_FORMATS,
+    IMAGE_VARIANT_WIDTHS,
+    IMAGE_VARIANTS_DIR,
+    MAX_IMAGE_DIMENSION,
+    PROCESSED_IMAGES_DIR
+)
+from recipes.models import Recipe
+from .versions import bump_version, RECIPES_VERSION
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Пул фоновых потоков обработки изображений процесса."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                    thread_name_prefix='image-processing'
+                )
+    return _executor
+
+
+def is_processed(name):
+    return name.startswith(PROCESSED_IMAGES_DIR)
+
+
+def is_ready(recipe):
+    """Изображение обработано и для него есть уменьшенные копии."""
+    name = recipe.image.name
+    return (
+        is_processed(name)
+        and recipe.image_variants.get('source') == name
+    )
+
+
+def store(name, render):
+    """
+    Сохраняет файл с именем по хешу содержимого.
+    Такие файлы неизменяемы, поэтому существующий не перезаписывается.
+    """
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(render()))
+    return name
+
+
+def encode(image, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=IMAGE_QUALITY, **options)
+    return buffer.getvalue()
+
+
+def encode_image(file):
+    """
+    Поворачивает изображение по EXIF, уменьшает до MAX_IMAGE_DIMENSION
+    и перекодирует в JPEG без метаданных.
+    """
+    image = ImageOps.exif_transpose(Image.open(file))
+    image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    return encode(image, 'JPEG', optimize=True, progressive=True)
+
+
+def render_variants(content, digest):
+    """
+    Уменьшенные копии изображения шириной IMAGE_VARIANT_WIDTHS
+    во всех форматах IMAGE_VARIANT_FORMATS: {ширина: {формат: имя}}.
+    """
+    image = Image.open(BytesIO(content))
+    image.load()
+    widths = [
+        width for width in IMAGE_VARIANT_WIDTHS if width < image.width
+    ] or [image.width]
+    variants = {}
+    for width in widths:
+        height = max(round(image.height * width / image.width), 1)
+        resized = image.resize((width, height), Image.LANCZOS)
+        variants[str(width)] = {
+            extension: store(
+                f'{IMAGE_VARIANTS_DIR}{digest}-{width}.{extension}',
+                lambda: encode(resized, image_format)
+            )
+            for extension, image_format in IMAGE_VARIANT_FORMATS
+        }
+    return variants
+
+
+def render_image(name):
+    """
+    Готовит обработанное изображение и его уменьшенные копии.
+    Не обращается к базе данных, поэтому может выполняться
+    в отдельном процессе.
+    """
+    with default_storage.open(name) as file:
+        content = file.read() if is_processed(name) else encode_image(file)
+    digest = sha1(content).hexdigest()[:20]
+    processed = name
+    if not is_processed(name):
+        processed = store(
+            f'{PROCESSED_IMAGES_DIR}{digest}.jpg', lambda: content
+        )
+    return processed, {
+        'source': processed,
+        'variants': render_variants(content, digest),
+    }
+
+
+def apply_rendered(recipe_id, name, processed, variants):
+    """
+    Переключает рецепт на обработанное изображение, если за это время
+    изображение не заменили.
+    """
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image=processed,
+        image_variants=variants
+    )
+    if updated:
+        if processed != name:
+            default_storage.delete(name)
+        bump_version(RECIPES_VERSION)
+    return updated
+
+
+def process_image(recipe_id, name):
+    if not Recipe.objects.filter(pk=recipe_id, image=name).exists():
+        return
+    apply_rendered(recipe_id, name, *render_image(name))
+
+
+def run_in_worker(recipe_id, name):
+    try:
+        process_image(recipe_id, name)
+    except Exception:
+        logger.exception('Failed to process image %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_image_processing(recipe):
+    """
+    Ставит обработку изображения рецепта в фоновый пул после
+    фиксации транзакции. При IMAGE_PROCESSING_WORKERS = 0
+    обработка выполняется сразу.
+    """
+    name = recipe.image.name
+    if not name or is_ready(recipe):
+        return
+    if not settings.IMAGE_PROCESSING_WORKERS:
+        transaction.on_commit(lambda: process_image(recipe.pk, name))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(run_in_worker, recipe.pk, name)
+    )
@@ -1,8 +1,248 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import partial, reduce
+from hashlib import md5
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.constants import (
+    COUNT_CACHE_TIMEOUT,
+    CURSOR_QUERY_PARAM,
+    PAGE_SIZE_QUERY_PARAM,
+    PAGE_SIZE
+)
+from .versions import get_versions
+
+
+def estimate_count(queryset):
+    """Оценка числа строк выборки планировщиком PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class BoundedPage(Page):
+    """Страница, у которой общее число записей может быть неточным."""
+
+    def has_next(self):
+        if self.paginator.count_exact:
+            return super().has_next()
+        return len(self.object_list) == self.paginator.per_page
+
+
+class BoundedPaginator(Paginator):
+    """
+    Paginator с заранее посчитанным числом записей.
+    Если число неточное, страницы за его пределами тоже доступны.
+    """
+
+    def __init__(self, object_list, per_page, count, count_exact, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+        self.count_exact = count_exact
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        if self.count_exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
 
-from recipes.constants import PAGE_SIZE_QUERY_PARAM, PAGE_SIZE
+    def _get_page(self, *args, **kwargs):
+        return BoundedPage(*args, **kwargs)
 
 
 class CustomPaginator(pagination.PageNumberPagination):
+    """
+    Постраничная пагинация (page/limit).
+    Число записей берется из кеша по сигнатуре запроса; если оно
+    больше PAGINATION_COUNT_THRESHOLD, считается только до порога
+    или оценивается планировщиком, а в ответе count_exact = false.
+    Если в запросе передан параметр cursor, включается пагинация
+    по ключу (keyset): выборка продолжается после последней записи
+    предыдущей страницы по полям сортировки (полям модели или
+    аннотациям, например search_rank) и id, без COUNT и OFFSET.
+    Первая страница запрашивается с пустым cursor=.
+    """
     page_size = PAGE_SIZE
     page_size_query_param = PAGE_SIZE_QUERY_PARAM
+    cursor_query_param = CURSOR_QUERY_PARAM
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            self.count, self.count_exact = self.get_count(
+                queryset, request, view
+            )
+            self.django_paginator_class = partial(
+                BoundedPaginator,
+                count=self.count,
+                count_exact=self.count_exact
+            )
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def get_count_cache_key(self, queryset, request, view):
+        versions = ''
+        if hasattr(view, 'get_cache_versions'):
+            versions = get_versions(view.get_cache_versions(request))
+        sql, params = queryset.query.sql_with_params()
+        signature = md5(f'{sql}{params!r}'.encode()).hexdigest()
+        return f'count:{versions}:{signature}'
+
+    def count_queryset(self, queryset):
+        """Число записей и признак того, что оно точное."""
+        threshold = settings.PAGINATION_COUNT_THRESHOLD
+        queryset = queryset.order_by()
+        count = queryset[:threshold + 1].count()
+        if count <= threshold:
+            return count, True
+        if settings.PAGINATION_COUNT_ESTIMATE:
+            estimate = estimate_count(queryset)
+            if estimate is not None:
+                return max(estimate, threshold), False
+        return threshold, False
+
+    def get_count(self, queryset, request, view):
+        key = self.get_count_cache_key(queryset, request, view)
+        result = cache.get(key)
+        if result is None:
+            result = self.count_queryset(queryset)
+            cache.set(key, result, COUNT_CACHE_TIMEOUT)
+        return result
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return Response(OrderedDict((
+                ('count', self.count),
+                ('count_exact', self.count_exact),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            )))
+        return Response(OrderedDict((
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data),
+        )))
+
+    def get_ordering(self, queryset):
+        """Поля сортировки выборки, дополненные id для однозначности."""
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering.append('id')
+        return ordering
+
+    def encode_cursor(self, values):
+        return urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, fields):
+        try:
+            values = json.loads(
+                urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            )
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for field, value in zip(fields, values)
+            ]
+        except (ValueError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_keyset_filter(self, ordering, values):
+        """
+        Условие "строго после (v1, v2, ...)" в порядке сортировки:
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        """
+        conditions = []
+        for position, key in enumerate(ordering):
+            name = key.lstrip('-')
+            lookup = 'lt' if key.startswith('-') else 'gt'
+            equal = {
+                prev.lstrip('-'): value
+                for prev, value in zip(
+                    ordering[:position], values[:position]
+                )
+            }
+            conditions.append(
+                Q(**equal, **{f'{name}__{lookup}': values[position]})
+            )
+        return reduce(or_, conditions)
+
+    def paginate_keyset(self, queryset, request):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        annotations = queryset.query.annotations
+        fields = [
+            annotations[key.lstrip('-')].output_field
+            if key.lstrip('-') in annotations
+            else queryset.model._meta.get_field(key.lstrip('-'))
+            for key in ordering
+        ]
+        queryset = queryset.order_by(*ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_filter(
+                ordering, self.decode_cursor(cursor, fields)
+            ))
+        page = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(page) > self.page_size_value
+        page = page[:self.page_size_value]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = self.encode_cursor([
+                getattr(page[-1], key.lstrip('-'))
+                if key.lstrip('-') in annotations
+                else field.value_to_string(page[-1])
+                for key, field in zip(ordering, fields)
+            ])
+        return page
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor
+        )
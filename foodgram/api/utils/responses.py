@@ -1,21 +1,71 @@
 import csv
+import json
 
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
+from recipes.constants import EXPORT_FILENAME
 
-def download_csv(data):
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Строки списка покупок в формате csv."""
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['amount'],
+        ))
+
+
+def text_lines(rows):
+    """Строки списка покупок в текстовом формате."""
+    for row in rows:
+        yield '{} ({}) — {}\n'.format(
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['amount'],
+        )
+
+
+def json_lines(rows):
+    """Строки списка покупок в формате JSON Lines."""
+    for row in rows:
+        yield json.dumps(
+            {
+                'name': row['ingredient__name'],
+                'measurement_unit': row['ingredient__measurement_unit'],
+                'amount': row['amount'],
+            },
+            ensure_ascii=False
+        ) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'txt': (text_lines, 'text/plain'),
+    'jsonl': (json_lines, 'application/x-ndjson'),
+}
+
+
+def download_shopping_list(rows, export_format='csv'):
     """
-    Преобразует данные из словаря в csv формат
-    и возвращает HttpResponse класс для отправки клиенту.
+    Возвращает StreamingHttpResponse, который построчно формирует
+    файл списка покупок из итератора rows, не держа его в памяти.
     """
-    response = HttpResponse(content_type='text/csv')
-    response.write(u'\ufeff'.encode('utf8'))
-
-    field_name = data[0].keys()
-    writer = csv.DictWriter(response, field_name)
-    for ingredient in data:
-        writer.writerow(ingredient)
+    lines, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        lines(rows),
+        content_type=f'{content_type}; charset=utf-8'
+    )
     response['Content-Disposition'] = (
-        'attachment; filename="shopping_list.csv"'
+        f'attachment; filename="{EXPORT_FILENAME}.{export_format}"'
     )
     return response
@@ -0,0 +1,187 @@
+import re
+from bisect import bisect_left
+from threading import Lock
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from recipes.constants import (
+    MAX_SEARCH_TERMS,
+    SEARCH_CONFIG,
+    SEARCH_FTS_TABLE,
+    SEARCH_FTS_WEIGHTS
+)
+from recipes.models import Ingredient, Recipe
+from .versions import get_version, INGREDIENTS_VERSION
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для поиска по началу названия.
+    Строится при первом обращении и перестраивается, когда сигналы
+    Ingredient меняют версию данных.
+    Результаты упорядочены так, как их сортирует база данных по
+    Ingredient.Meta.ordering: порядок строк зависит от collation базы,
+    поэтому он запоминается при построении индекса, а не вычисляется
+    в Python.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._data = ((), (), ())
+
+    def _build(self):
+        ordered = list(
+            Ingredient.objects.order_by(
+                *Ingredient._meta.ordering
+            ).values('id', 'name', 'measurement_unit')
+        )
+        # Позиции в порядке базы, отсортированные по ключу поиска.
+        positions = sorted(
+            range(len(ordered)),
+            key=lambda position: ordered[position]['name'].casefold()
+        )
+        keys = [ordered[position]['name'].casefold() for position in positions]
+        return keys, positions, ordered
+
+    def _actual(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._data = self._build()
+                    self._version = version
+        return self._data
+
+    def search(self, terms=()):
+        """
+        Ингредиенты, название которых начинается с каждого из terms
+        (аналог фильтра ^name), без обращения к базе данных.
+        """
+        keys, positions, ordered = self._actual()
+        terms = [term.casefold() for term in terms]
+        if not terms:
+            return list(ordered)
+        prefix = max(terms, key=len)
+        result = []
+        for index in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[index].startswith(prefix):
+                break
+            if all(keys[index].startswith(term) for term in terms):
+                result.append(positions[index])
+        return [ordered[position] for position in sorted(result)]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_terms(text):
+    """Слова поискового запроса без служебных символов."""
+    return re.findall(r'\w+', text.casefold())[:MAX_SEARCH_TERMS]
+
+
+def search_recipes(queryset, text):
+    """
+    Рецепты, в названии или описании которых есть все слова text
+    (по началу слова), по убыванию релевантности (search_rank).
+    PostgreSQL ищет по search_vector с GIN-индексом,
+    SQLite — по таблице FTS5, остальные базы — через icontains.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    ordering = ('-search_rank', *Recipe._meta.ordering)
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            config=SEARCH_CONFIG,
+            search_type='raw'
+        )
+        # ts_rank возвращает real: после JSON курсора значение не равно
+        # себе при сравнении с double, и keyset повторяет строки.
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query), FloatField()
+            )
+        ).order_by(*ordering)
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(
+            search_index__isnull=False
+        ).filter(
+            RawSQL(
+                f'{SEARCH_FTS_TABLE} MATCH %s',
+                (match,),
+                output_field=BooleanField()
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f'-bm25({SEARCH_FTS_TABLE}, %s, %s)',
+                SEARCH_FTS_WEIGHTS,
+                output_field=FloatField()
+            )
+        ).order_by(*ordering)
+    for term in terms:
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(text__icontains=term)
+        )
+    return queryset
+
+
+def index_recipe(recipe):
+    """
+    Обновляет рецепт в таблице FTS5 SQLite.
+    В PostgreSQL search_vector обновляет триггер базы данных.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_FTS_TABLE} WHERE rowid = %s', (recipe.pk,)
+        )
+        cursor.execute(
+            f'INSERT INTO {SEARCH_FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)',
+            (recipe.pk, recipe.name, recipe.text)
+        )
+
+
+def unindex_recipes(recipe_ids):
+    """Удаляет рецепты из таблицы FTS5 SQLite одним запросом."""
+    recipe_ids = list(recipe_ids)
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_FTS_TABLE} WHERE rowid IN '
+            f'({", ".join(["%s"] * len(recipe_ids))})',
+            recipe_ids
+        )
+
+
+def rebuild_search_index():
+    """
+    Пересчитывает поисковый индекс всех рецептов, например после
+    bulk_create, который не вызывает сигналов.
+    """
+    if connection.vendor == 'postgresql':
+        Recipe.objects.update(
+            search_vector=SearchVector(
+                'name', weight='A', config=SEARCH_CONFIG
+            ) + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SEARCH_FTS_TABLE} (rowid, name, text) '
+                f'SELECT id, name, text FROM {Recipe._meta.db_table}'
+            )
@@ -0,0 +1,268 @@
+import base64
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from itertools import accumulate
+from random import Random
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment
+)
+from PIL import Image
+
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+    User
+)
+from .counters import recount
+from .search import rebuild_search_index
+from .tag_masks import rebuild_tag_masks
+from .versions import (
+    bump_on_commit,
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    USERS_VERSION,
+    VERSIONS_CACHE
+)
+
+# Словарь для названий и описаний рецептов в seed_data.
+SEED_DISHES = (
+    'салат', 'суп', 'борщ', 'пирог', 'омлет', 'каша', 'рагу', 'плов',
+    'запеканка', 'блины', 'котлеты', 'паста', 'торт', 'соус', 'десерт',
+)
+SEED_WORDS = (
+    'курица', 'говядина', 'рыба', 'грибы', 'сыр', 'томаты', 'картофель',
+    'морковь', 'лук', 'чеснок', 'сметана', 'молоко', 'яйца', 'мука',
+    'сахар', 'масло', 'рис', 'гречка', 'капуста', 'свекла', 'яблоки',
+    'ягоды', 'шоколад', 'базилик', 'укроп', 'перец', 'тыква', 'фасоль',
+    'нарезать', 'обжарить', 'варить', 'запечь', 'смешать', 'посолить',
+    'остудить', 'подавать', 'минут', 'сковороде', 'духовке', 'кастрюле',
+)
+SEED_IMAGE = 'recipes/images/seed.png'
+SCRATCH_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        VERSIONS_CACHE: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': VERSIONS_CACHE,
+        },
+    },
+    'IMAGE_PROCESSING_WORKERS': 0,
+}
+
+
+@contextmanager
+def scratch_database():
+    """
+    Временная база данных, кеш в памяти и временный MEDIA_ROOT
+    для команд измерений: данные рабочей базы не затрагиваются.
+    """
+    setup_test_environment()
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root, **SCRATCH_SETTINGS):
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+            )
+            try:
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+        teardown_test_environment()
+
+
+def image_data(size=(8, 8), color='white'):
+    """Изображение PNG в формате data URI, как его отправляет фронтенд."""
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def store_seed_image():
+    """Файл изображения, на который ссылаются рецепты seed_data."""
+    if not default_storage.exists(SEED_IMAGE):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'white').save(buffer, 'PNG')
+        default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+
+
+def popularity(count):
+    """Накопленные веса по закону Ципфа: первые строки выбираются чаще."""
+    return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+def pick(random, rows, count, weights=None):
+    """
+    До count разных строк из rows. С весами weights популярные
+    строки выбираются чаще, а повторы отбрасываются.
+    """
+    count = min(count, len(rows))
+    if weights is None:
+        return random.sample(rows, count)
+    return list(dict.fromkeys(
+        random.choices(rows, cum_weights=weights, k=count)
+    ))
+
+
+def seed_data(recipes=1000, users=100, ingredients=500, tags=8,
+              per_recipe=8, per_user=20, follows=10, seed=0,
+              batch_size=1000, vary=False):
+    """
+    Детерминированный набор данных для проверок производительности:
+    одинаковые seed и размеры дают одинаковые строки.
+    На каждого пользователя приходится per_user рецептов в избранном
+    и столько же в списке покупок, а также follows подписок.
+    С vary=True эти числа и число ингредиентов рецепта случайны
+    с теми же средними, а авторы, рецепты и подписки распределены
+    по популярности, как в живых данных.
+    """
+    random = Random(seed)
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+    def fan_out(average, minimum=0):
+        if not vary:
+            return average
+        return random.randint(minimum, max(2 * average - minimum, minimum))
+
+    def weights(rows):
+        return popularity(len(rows)) if vary else None
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=f'user{number}',
+                    email=f'user{number}@example.com',
+                    first_name=f'Имя {number}',
+                    last_name=f'Фамилия {number}',
+                    password='!'
+                )
+                for number in range(users)
+            ),
+            batch_size=batch_size
+        )
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'Тег {number}',
+                slug=f'tag{number}',
+                color=f'#{random.randrange(0x1000000):06X}'
+            )
+            for number in range(tags)
+        )
+        tags = Tag.objects.assign_bits()
+        ingredients = Ingredient.objects.bulk_create(
+            (
+                Ingredient(
+                    name=f'ингредиент {number}',
+                    measurement_unit=random.choice(('г', 'мл', 'шт.'))
+                )
+                for number in range(ingredients)
+            ),
+            batch_size=batch_size
+        )
+        author_weights = weights(users)
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    name='{} {} {}'.format(
+                        random.choice(SEED_DISHES),
+                        random.choice(SEED_WORDS),
+                        number
+                    ),
+                    text=' '.join(random.choices(SEED_WORDS, k=30)),
+                    cooking_time=random.randint(1, 180),
+                    author=pick(random, users, 1, author_weights)[0],
+                    image=SEED_IMAGE
+                )
+                for number in range(recipes)
+            ),
+            batch_size=batch_size
+        )
+        # auto_now_add заполняет pub_date при вставке, поэтому
+        # детерминированные даты записываются отдельным UPDATE.
+        for number, recipe in enumerate(recipes):
+            recipe.pub_date = start + timedelta(minutes=number)
+        Recipe.objects.bulk_update(
+            recipes, ('pub_date',), batch_size=batch_size
+        )
+        ingredient_weights = weights(ingredients)
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=random.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient in pick(
+                    random,
+                    ingredients,
+                    fan_out(per_recipe, 1),
+                    ingredient_weights
+                )
+            ),
+            batch_size=batch_size
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in random.sample(tags, random.randint(1, 3))
+            ),
+            batch_size=batch_size
+        )
+        recipe_weights = weights(recipes)
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                (
+                    model(user=user, recipe=recipe)
+                    for user in users
+                    for recipe in pick(
+                        random, recipes, fan_out(per_user), recipe_weights
+                    )
+                ),
+                batch_size=batch_size
+            )
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, author=author)
+                for user in users
+                for author in pick(
+                    random, users, fan_out(follows) + 1, author_weights
+                )
+                if author != user
+            ),
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        # bulk_create не шлет сигналов: списки покупок, поисковый
+        # индекс, маски тегов, счетчики и версии кеша обновляются явно.
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        rebuild_search_index()
+        rebuild_tag_masks()
+        recount()
+        bump_on_commit(
+            INGREDIENTS_VERSION, TAGS_VERSION, RECIPES_VERSION, USERS_VERSION
+        )
+    return users, recipes
@@ -0,0 +1,144 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def change_amounts(users, amounts):
+    """
+    Прибавляет amounts ({ingredient_id: изменение}) к спискам покупок
+    пользователей users (список id или подзапрос values_list).
+    Недостающие строки создаются, количество меняется одним UPDATE
+    через F(), строки с нулевым количеством удаляются.
+    """
+    amounts = {pk: delta for pk, delta in amounts.items() if delta}
+    if not amounts:
+        return
+    items = ShoppingListItem.objects.filter(
+        user__in=users,
+        ingredient__in=amounts
+    )
+    added = [pk for pk, delta in amounts.items() if delta > 0]
+    with transaction.atomic(savepoint=False):
+        if added:
+            ShoppingListItem.objects.bulk_create(
+                [
+                    ShoppingListItem(user_id=user_id, ingredient_id=pk)
+                    for user_id in users
+                    for pk in added
+                ],
+                ignore_conflicts=True
+            )
+        items.update(
+            amount=Greatest(
+                F('amount') + Case(
+                    *(
+                        When(ingredient_id=pk, then=Value(delta))
+                        for pk, delta in amounts.items()
+                    ),
+                    default=Value(0)
+                ),
+                Value(0)
+            )
+        )
+        items.filter(amount=0).delete()
+
+
+def update_shopping_lists(carts, sign=1):
+    """
+    Учитывает в списках покупок добавление (sign=1) или
+    удаление (sign=-1) строк корзины carts (QuerySet ShoppingCart).
+    """
+    if sign < 0:
+        subtract_carts(carts)
+        return
+    deltas = defaultdict(dict)
+    rows = carts.filter(
+        recipe__recipe_ingredients__isnull=False
+    ).values_list(
+        'user_id', 'recipe__recipe_ingredients__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__recipe_ingredients__amount')
+    ).order_by()
+    for user_id, ingredient_id, total in rows:
+        deltas[user_id][ingredient_id] = sign * total
+    change_lists(deltas)
+
+
+def change_lists(deltas):
+    """
+    Применяет изменения {user_id: {ingredient_id: изменение}}.
+    Пользователи с одинаковыми изменениями, например все, у кого
+    в корзине удаляемый рецепт, обновляются одним набором запросов.
+    """
+    groups = defaultdict(list)
+    for user_id, amounts in deltas.items():
+        groups[frozenset(amounts.items())].append(user_id)
+    for amounts, users in groups.items():
+        change_amounts(users, dict(amounts))
+
+
+def subtract_deleted_carts(rows):
+    """
+    Вычитает из списков покупок уже удаленные строки корзины rows
+    (объекты ShoppingCart с user_id и recipe_id).
+    """
+    users = defaultdict(list)
+    for row in rows:
+        users[row.recipe_id].append(row.user_id)
+    deltas = defaultdict(dict)
+    for recipe_id, ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe__in=users
+    ).order_by().values_list('recipe_id', 'ingredient_id', 'amount'):
+        for user_id in users[recipe_id]:
+            amounts = deltas[user_id]
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) - amount
+    change_lists(deltas)
+
+
+def subtract_carts(carts):
+    """
+    Вычитает строки корзины carts из списков покупок их владельцев
+    одним UPDATE с подзапросом, сколько бы пользователей и рецептов
+    ни затрагивало удаление.
+    """
+    # Подзапрос перебирает удаляемые рецепты пользователя, а не все
+    # рецепты с ингредиентом: популярный ингредиент есть в тысячах.
+    removed = RecipeIngredient.objects.filter(
+        ingredient=OuterRef('ingredient'),
+        recipe__in=carts.filter(
+            user=OuterRef(OuterRef('user'))
+        ).values('recipe')
+    ).order_by().values('ingredient').annotate(
+        total=Sum('amount')
+    ).values('total')
+    items = ShoppingListItem.objects.filter(
+        user__in=carts.values('user'),
+        ingredient__in=RecipeIngredient.objects.filter(
+            recipe__shoppingcart__in=carts
+        ).values('ingredient')
+    )
+    with transaction.atomic(savepoint=False):
+        items.update(
+            amount=Greatest(
+                F('amount') - Coalesce(Subquery(removed), Value(0)),
+                Value(0)
+            )
+        )
+        items.filter(amount=0).delete()
+
+
+def update_recipe_amounts(recipe_id, amounts):
+    """
+    Учитывает изменение ингредиентов рецепта ({ingredient_id: изменение})
+    в списках покупок всех пользователей, у которых он в корзине.
+    """
+    change_amounts(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True),
+        amounts
+    )
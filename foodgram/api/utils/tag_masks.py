@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+from django.db.models import F, Q
+
+from recipes.models import Recipe
+
+
+def recipe_masks(recipe_ids=None):
+    """Маски тегов рецептов recipe_ids (всех, если не указаны)."""
+    masks = defaultdict(int)
+    rows = Recipe.tags.through.objects.filter(
+        tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit')
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    for recipe_id, bit in rows.iterator():
+        masks[recipe_id] |= 1 << bit
+    return masks
+
+
+def update_tag_masks(recipe_ids, batch_size=1000):
+    """Пересчитывает Recipe.tag_mask по связям рецептов с тегами."""
+    masks = dict.fromkeys(recipe_ids, 0)
+    masks.update(recipe_masks(recipe_ids))
+    Recipe.objects.bulk_update(
+        [Recipe(id=pk, tag_mask=mask) for pk, mask in masks.items()],
+        ('tag_mask',),
+        batch_size=batch_size
+    )
+
+
+def rebuild_tag_masks(batch_size=1000):
+    """Пересчитывает маски всех рецептов, например после bulk_create."""
+    masks = recipe_masks()
+    Recipe.objects.exclude(id__in=masks).update(tag_mask=0)
+    update_tag_masks(masks, batch_size)
+
+
+def remove_tag_bit(tag):
+    """Снимает бит удаляемого тега со всех рецептов одним UPDATE."""
+    with_tag(Recipe.objects.all(), tag.mask).update(
+        tag_mask=F('tag_mask').bitand(~tag.mask)
+    )
+
+
+def with_tag(queryset, mask):
+    """Рецепты, у которых есть хотя бы один тег из mask."""
+    return queryset.alias(
+        tag_match=F('tag_mask').bitand(mask)
+    ).filter(tag_match__gt=0)
+
+
+def filter_by_tags(queryset, tags, match_all=False):
+    """
+    Рецепты с любым (match_all=False) или со всеми тегами tags.
+    Теги с битом проверяются одним условием на Recipe.tag_mask без JOIN
+    и DISTINCT, теги без бита (сверх MAX_TAG_BITS) - подзапросом
+    по связям рецептов с тегами.
+    """
+    mask = 0
+    unmasked = []
+    for tag in tags:
+        mask |= tag.mask
+        if tag.bit is None:
+            unmasked.append(tag)
+    tagged = Recipe.tags.through.objects.values('recipe')
+    queryset = queryset.alias(tag_match=F('tag_mask').bitand(mask))
+    if match_all:
+        queryset = queryset.filter(tag_match=mask)
+        for tag in unmasked:
+            queryset = queryset.filter(id__in=tagged.filter(tag=tag))
+        return queryset
+    condition = Q(tag_match__gt=0)
+    if unmasked:
+        condition |= Q(id__in=tagged.filter(tag__in=unmasked))
+    return queryset.filter(condition)
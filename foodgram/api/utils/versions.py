@@ -0,0 +1,50 @@
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+VERSIONS_CACHE = 'versions'
+VERSION_KEY = 'version:{}'
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+RECIPES_VERSION = 'recipes'
+USERS_VERSION = 'users'
+
+# Версии лежат в отдельном кеше, чтобы их не вытесняли ответы.
+versions_cache = ConnectionProxy(caches, VERSIONS_CACHE)
+
+
+def get_version(name):
+    """
+    Текущая версия набора данных name.
+    Если ключ вытеснен из кеша, создается новая версия, поэтому
+    устаревшие данные никогда не считаются актуальными.
+    """
+    return versions_cache.get_or_set(
+        VERSION_KEY.format(name), uuid4().hex, timeout=None
+    )
+
+
+def bump_version(name):
+    """Меняет версию набора данных name после его изменения."""
+    version = uuid4().hex
+    versions_cache.set(VERSION_KEY.format(name), version, timeout=None)
+    return version
+
+
+def bump_on_commit(*names):
+    """Меняет версии после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: [bump_version(name) for name in names]
+    )
+
+
+def user_version(user_id):
+    """Имя версии избранного, списка покупок и подписок пользователя."""
+    return f'user:{user_id}'
+
+
+def get_versions(names):
+    """Строка из текущих версий наборов данных names."""
+    return ':'.join(get_version(name) for name in names)
@@ -1,30 +1,58 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from rest_framework.permissions import IsAuthenticated, AllowAny, SAFE_METHODS
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.views import APIView
 
+from .middleware import reset_view_stats, view_stats
+from .utils.caching import CachedResponseMixin
+from .utils.counters import update_counters
+from .utils.functions import (
+    annotate_recipes,
+    delete_user_rows,
+    get_recipes_limit
+)
 from .utils.paginators import CustomPaginator
-from .utils.responses import download_csv
+from .utils.renderers import CSVRenderer, TextRenderer, JSONLinesRenderer
+from .utils.responses import download_shopping_list, EXPORT_FORMATS
+from .utils.search import ingredient_index
+from .utils.shopping_list import update_shopping_lists
+from .utils.versions import (
+    bump_on_commit,
+    user_version,
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    USERS_VERSION
+)
 from .filters import RecipeFilter, IngredientSearchFilter
+from recipes.constants import EXPORT_CHUNK_SIZE, FEED_CACHE_PARAMS
 from recipes.models import (
     Tag,
     Recipe,
     User,
     Ingredient,
-    ShoppingCart,
-    Favorite,
     Follow,
-    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
 )
 from .serializers import (
     TagSerializer,
     RecipeSerializer,
     RecipeCreateUpdateSerializer,
+    RecipeIdsSerializer,
     IngredientSerializer,
     ShoppingCartSerizlizer,
     FavoriteRecipeSerializer,
@@ -40,6 +68,12 @@ class CustomUserViewSet(UserViewSet):
     """
     pagination_class = CustomPaginator
 
+    def get_cache_versions(self, request):
+        """Наборы данных, от которых зависит число пользователей."""
+        if request.user.is_authenticated:
+            return (USERS_VERSION, user_version(request.user.id))
+        return (USERS_VERSION,)
+
     @action(
         methods=('post', 'delete',),
         detail=True,
@@ -53,7 +87,10 @@ class CustomUserViewSet(UserViewSet):
                     'author': author.id,
                     'user': request.user.id
                 },
-                context={'request': request}
+                context={
+                    'request': request,
+                    'recipes_limit': get_recipes_limit(request)
+                }
             )
             follow.is_valid(raise_exception=True)
             follow.save()
@@ -61,11 +98,10 @@ class CustomUserViewSet(UserViewSet):
                 follow.data,
                 status=status.HTTP_201_CREATED
             )
-        get_object_or_404(
-            Follow,
-            user=request.user,
-            author=author
-        ).delete()
+        if not delete_user_rows(
+            Follow.objects.filter(user=request.user, author=author)
+        ):
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -74,8 +110,9 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(
-            following__user=request.user.id
+        queryset = annotate_recipes(
+            User.objects.filter(following__user=request.user.id),
+            get_recipes_limit(request)
         )
         serializer = FollowingUserSerializer(
             self.paginate_queryset(queryset),
@@ -85,37 +122,71 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, ReadOnlyModelViewSet):
     """Представление ингридиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     filter_backends = (IngredientSearchFilter,)
     search_fields = ('^name',)
+    cache_versions = (INGREDIENTS_VERSION,)
 
+    def list(self, request, *args, **kwargs):
+        """Поиск по началу названия через индекс в памяти."""
+        return self.cached_response(request, self.search, *args, **kwargs)
 
-class TagViewSet(ReadOnlyModelViewSet):
+    def search(self, request, *args, **kwargs):
+        terms = IngredientSearchFilter().get_search_terms(request)
+        return Response(ingredient_index.search(terms))
+
+
+class TagViewSet(CachedResponseMixin, ReadOnlyModelViewSet):
     """Представление тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     lookup_field = 'slug'
+    cache_versions = (TAGS_VERSION,)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(CachedResponseMixin, ModelViewSet):
     """
     CRUD моделей Favorite, ShoppingCart,
     Recipe, RecipeIngredient.
     """
-    queryset = Recipe.objects.prefetch_related(
-        'tags', 'ingredients'
-    ).select_related('author')
+    queryset = Recipe.objects.with_related()
     pagination_class = CustomPaginator
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    lookup_value_regex = r'\d+'
+    cache_versions = (RECIPES_VERSION,)
+
+    def get_queryset(self):
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def get_cache_versions(self, request):
+        if request.user.is_authenticated:
+            return self.cache_versions + (user_version(request.user.id),)
+        return self.cache_versions
+
+    def is_response_cacheable(self, request):
+        """Кешируется только лента рецептов для анонимных пользователей."""
+        return (
+            self.action == 'list'
+            and not request.user.is_authenticated
+            and set(request.query_params) <= set(FEED_CACHE_PARAMS)
+            and super().is_response_cacheable(request)
+        )
+
+    def get_cache_params(self, request):
+        return [
+            (key, sorted(set(request.query_params.getlist(key))))
+            for key in FEED_CACHE_PARAMS
+            if any(request.query_params.getlist(key))
+        ]
 
     def get_permissions(self):
-        if self.request.method in SAFE_METHODS:
+        if self.action in ('list', 'retrieve'):
             self.permission_classes = (AllowAny,)
         else:
             self.permission_classes = (IsAuthenticated,)
@@ -126,38 +197,146 @@ class RecipeViewSet(ModelViewSet):
             return RecipeSerializer
         return RecipeCreateUpdateSerializer
 
-    def delete_action(self, request, pk, serializer, model):
-        """Удаление объекта модели favorite/shopping_cart."""
-        obj = serializer(
-            data={
-                'recipe': pk,
-                'user': request.user.id
-            },
-            context={'request': request}
-        )
-        obj.is_valid(raise_exception=True)
-        self.perform_destroy(
-            model.objects.filter(recipe=pk, user=request.user.id)
-        )
-
+    def delete_action(self, request, pk, serializer):
+        """
+        Удаление объекта модели favorite/shopping_cart
+        одним запросом DELETE.
+        """
+        if not delete_user_rows(
+            serializer.Meta.model.objects.filter(
+                recipe=pk,
+                user=request.user
+            )
+        ):
+            raise ValidationError({'error': serializer.missing_message})
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def create_action(self, request, pk, serializer):
-        """Создание объекта модели favorite/shopping_cart."""
-        obj = serializer(
-            data={
-                'recipe': pk,
-                'user': request.user.id
-            },
-            context={'request': request}
-        )
-        obj.is_valid(raise_exception=True)
-        obj.save()
+        """
+        Создание объекта модели favorite/shopping_cart
+        одним запросом INSERT: повтор отклоняет ограничение уникальности.
+        """
+        try:
+            with transaction.atomic():
+                obj = serializer.Meta.model.objects.create(
+                    recipe_id=pk,
+                    user=request.user
+                )
+        except IntegrityError:
+            if not Recipe.objects.filter(pk=pk).exists():
+                raise ValidationError({'error': 'Рецепт не найден.'})
+            raise ValidationError({'error': serializer.exists_message})
         return Response(
-            obj.data,
+            serializer(obj, context={'request': request}).data,
             status=status.HTTP_201_CREATED
         )
 
+    def bulk_action(self, request, serializer):
+        """
+        Добавление/удаление списка рецептов в favorite/shopping_cart
+        в одной транзакции. Возвращает результат для каждого id.
+        """
+        ids = RecipeIdsSerializer(data=request.data)
+        ids.is_valid(raise_exception=True)
+        ids = ids.validated_data['recipes']
+        model = serializer.Meta.model
+        rows = model.objects.filter(user=request.user)
+        try:
+            with transaction.atomic():
+                if request.method == 'POST':
+                    present = set(
+                        rows.select_for_update().filter(
+                            recipe__in=ids
+                        ).values_list('recipe_id', flat=True)
+                    )
+                    found = set(
+                        Recipe.objects.filter(
+                            id__in=ids
+                        ).values_list('id', flat=True)
+                    )
+                    created = [pk for pk in ids if pk in found - present]
+                    rows_created = model.objects.bulk_create([
+                        model(user=request.user, recipe_id=pk)
+                        for pk in created
+                    ])
+                    if created:
+                        # bulk_create не шлет сигналов.
+                        bump_on_commit(user_version(request.user.id))
+                        update_counters(model, rows_created)
+                        if model is ShoppingCart:
+                            update_shopping_lists(
+                                rows.filter(recipe__in=created)
+                            )
+                    results = [
+                        {'id': pk, 'status': 'created'} if pk in created
+                        else {
+                            'id': pk,
+                            'status': 'exists',
+                            'error': serializer.exists_message
+                        } if pk in found
+                        else {
+                            'id': pk,
+                            'status': 'not_found',
+                            'error': 'Рецепт не найден.'
+                        }
+                        for pk in ids
+                    ]
+                else:
+                    present = {
+                        row.recipe_id
+                        for row in delete_user_rows(
+                            rows.filter(recipe__in=ids)
+                        )
+                    }
+                    results = [
+                        {'id': pk, 'status': 'deleted'} if pk in present
+                        else {
+                            'id': pk,
+                            'status': 'missing',
+                            'error': serializer.missing_message
+                        }
+                        for pk in ids
+                    ]
+        except IntegrityError:
+            # Параллельный запрос успел добавить те же рецепты.
+            raise ValidationError({
+                'error': 'Список изменился во время запроса, '
+                         'повторите попытку.'
+            })
+        return Response({'results': results})
+
+    @action(
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-bulk'
+    )
+    def favorite_bulk(self, request):
+        """Пакетное добавление/удаление рецептов в избранном."""
+        return self.bulk_action(request, FavoriteRecipeSerializer)
+
+    @action(
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        """Пакетное добавление/удаление рецептов в списке покупок."""
+        return self.bulk_action(request, ShoppingCartSerizlizer)
+
+    @action(
+        methods=('delete',),
+        permission_classes=(IsAuthenticated,),
+        detail=False
+    )
+    def clear_shopping_cart(self, request):
+        """Очистка списка покупок одним запросом DELETE."""
+        delete_user_rows(ShoppingCart.objects.filter(user=request.user))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         methods=('post', 'delete'),
         permission_classes=(IsAuthenticated,),
@@ -174,8 +353,7 @@ class RecipeViewSet(ModelViewSet):
         return self.delete_action(
             request,
             pk,
-            FavoriteRecipeSerializer,
-            Favorite
+            FavoriteRecipeSerializer
         )
 
     @action(
@@ -194,26 +372,46 @@ class RecipeViewSet(ModelViewSet):
         return self.delete_action(
             request,
             pk,
-            ShoppingCartSerizlizer,
-            ShoppingCart
+            ShoppingCartSerizlizer
         )
 
     @action(
         methods=('get',),
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            JSONRenderer,
+            CSVRenderer,
+            TextRenderer,
+            JSONLinesRenderer,
+        ),
         detail=False
     )
     def download_shopping_cart(self, request):
-        """Создание/скачивание файла списка покупок."""
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shoppingcart__user=request.user
-        ).select_related(
-            'author'
-        ).prefetch_related(
-            'tags', 'ingredients'
+        """
+        Скачивание файла списка покупок.
+        Формат выбирается параметром format= (csv, txt, jsonl).
+        """
+        export_format = request.accepted_renderer.format
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'csv'
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            amount=Sum('amount')
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
+        return download_shopping_list(
+            ingredients.iterator(chunk_size=EXPORT_CHUNK_SIZE),
+            export_format
         )
-        return download_csv(ingredients)
+
+
+class RequestTimingView(APIView):
+    """Показатели RequestTimingMiddleware по представлениям."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(view_stats())
+
+    def delete(self, request):
+        reset_view_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
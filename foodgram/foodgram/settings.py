@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -35,6 +36,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Число и время запросов к БД в заголовке Server-Timing и журнале.
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', 'False').lower() == 'true'
+REQUEST_TIMING_SLOW_MS = float(os.getenv('REQUEST_TIMING_SLOW_MS', '500'))
+REQUEST_TIMING_MAX_QUERIES = int(
+    os.getenv('REQUEST_TIMING_MAX_QUERIES', '20')
+)
+if REQUEST_TIMING:
+    MIDDLEWARE.insert(0, 'api.middleware.RequestTimingMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -60,6 +70,13 @@ if DEBUG:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            # Тестовая база в файле, а не в памяти: тесты конкурентных
+            # запросов обращаются к ней из нескольких потоков.
+            'TEST': {
+                'NAME': os.path.join(
+                    tempfile.gettempdir(), 'foodgram_test.sqlite3'
+                ),
+            },
         }
     }
 
@@ -75,6 +92,38 @@ else:
         }
     }
 
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    'django.core.cache.backends.filebased.FileBasedCache'
+)
+CACHES = {
+    # Ответы API и числа записей для пагинации.
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+    # Версии наборов данных хранятся отдельно: при переполнении кеша
+    # ответов вытеснение версии сбросило бы все зависящие от нее ответы.
+    'versions': {
+        'BACKEND': os.getenv('VERSIONS_CACHE_BACKEND', CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'VERSIONS_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_versions')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('VERSIONS_CACHE_MAX_ENTRIES', '100000')
+            ),
+        },
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,6 +157,8 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', '2'))
+
 AUTH_USER_MODEL = 'recipes.User'
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
@@ -119,6 +170,13 @@ REST_FRAMEWORK = {
     ),
 }
 
+PAGINATION_COUNT_THRESHOLD = int(
+    os.getenv('PAGINATION_COUNT_THRESHOLD', '10000')
+)
+PAGINATION_COUNT_ESTIMATE = (
+    os.getenv('PAGINATION_COUNT_ESTIMATE', 'True').lower() == 'true'
+)
+
 DJOSER = {
     'SERIALIZERS': {
         'user': 'api.serializers.CustomUserSerializer',
@@ -28,6 +28,7 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 0
     min_num = 1
     formset = CustomBaseInlineFormSet
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Ingredient)
@@ -38,7 +39,7 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement_unit',
     )
     list_filter = (
-        'name',
+        'measurement_unit',
     )
     search_fields = ('name',)
 
@@ -50,12 +51,16 @@ class RecipeAdmin(admin.ModelAdmin):
         'id',
         'name',
         'author',
+        'favorites_count',
+        'in_carts_count',
     )
     list_filter = (
-        'author',
-        'name',
-        'tags'
+        'tags',
     )
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
 
 
 @admin.register(Tag)
@@ -75,6 +80,10 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'user',
         'recipe',
     )
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(User)
@@ -83,16 +92,17 @@ class UserAdmin(admin.ModelAdmin):
         'id',
         'username',
         'email',
-        'recipes_count'
+        'recipes_count',
+        'followers_count',
+        'following_count',
     )
     list_filter = (
-        'email',
-        'username'
+        'is_staff',
+        'is_active',
     )
+    search_fields = ('username', 'email')
     exclude = ('password',)
-
-    def recipes_count(self, obj):
-        return obj.recipes.all().count()
+    show_full_result_count = False
 
 
 @admin.register(Favorite)
@@ -103,6 +113,10 @@ class FavoriteAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 class FollowForm(forms.ModelForm):
@@ -128,3 +142,7 @@ class FollowAdmin(admin.ModelAdmin):
         'user',
         'sub_date'
     )
+    list_select_related = ('author', 'user')
+    search_fields = ('author__username', 'user__username')
+    autocomplete_fields = ('author', 'user')
+    show_full_result_count = False
@@ -5,7 +5,39 @@ MAX_LENGTH_EMAIL: int = 254
 MAX_LENGTH_USER_MODEL: int = 150
 MIN_VALUE_FIELD_AMOUNT_COOKINGTIME: int = 1
 HEX_COLOR_REGEX: str = r'^#([a-fA-F0-9]{6})$'
+# Bits 0..62 of the signed 64-bit Recipe.tag_mask.
+MAX_TAG_BITS: int = 63
 
 # Constants for paginators
 PAGE_SIZE: int = 6
 PAGE_SIZE_QUERY_PARAM: str = 'limit'
+CURSOR_QUERY_PARAM: str = 'cursor'
+COUNT_CACHE_TIMEOUT: int = 60 * 5
+
+# Constants for shopping list export
+EXPORT_CHUNK_SIZE: int = 2000
+EXPORT_FILENAME: str = 'shopping_list'
+
+# Constants for bulk favorite/shopping cart requests
+MAX_BULK_RECIPES: int = 100
+
+# Constants for caching
+RESPONSE_CACHE_TIMEOUT: int = 60 * 60 * 24
+FEED_CACHE_PARAMS: tuple = (
+    'author', 'cursor', 'limit', 'page', 'tags', 'tags_mode'
+)
+
+# Constants for recipe search
+SEARCH_CONFIG: str = 'russian'
+SEARCH_FTS_TABLE: str = 'recipes_recipe_fts'
+SEARCH_FTS_WEIGHTS: tuple = (10.0, 1.0)
+MAX_SEARCH_TERMS: int = 10
+
+# Constants for images
+MAX_IMAGE_UPLOAD_SIZE: int = 20 * 1024 * 1024
+MAX_IMAGE_DIMENSION: int = 1600
+IMAGE_QUALITY: int = 85
+PROCESSED_IMAGES_DIR: str = 'recipes/images/processed/'
+IMAGE_VARIANTS_DIR: str = 'recipes/images/variants/'
+IMAGE_VARIANT_WIDTHS: tuple = (320, 640, 960)
+IMAGE_VARIANT_FORMATS: tuple = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
@@ -1,41 +1,209 @@
 import csv
+import io
+import json
 import os
+from itertools import islice
+from time import perf_counter
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from django.db.utils import IntegrityError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient, Tag
+from recipes.signals import rows_imported
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+TAG_FIELDS = ('name', 'slug', 'color')
+FORMATS = ('csv', 'json', 'jsonl')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Читает массив объектов JSON по частям: объекты разбираются
+    по мере чтения, весь файл в памяти не держится.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    expected = '['
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            buffer = file.read(chunk_size)
+            if not buffer:
+                raise CommandError('Unexpected end of the JSON file.')
+            continue
+        char = buffer[0]
+        if char not in expected:
+            raise CommandError(
+                f'Expected one of {expected!r} in the JSON file, '
+                f'found {char!r}.'
+            )
+        if char == '{':
+            try:
+                row, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as error:
+                # Объект не поместился в прочитанную часть файла.
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise CommandError(f'Invalid JSON file: {error}.')
+                buffer += chunk
+                continue
+            yield row
+            buffer = buffer[end:]
+            expected = ',]'
+        else:
+            buffer = buffer[1:]
+            if char == ']':
+                return
+            expected = '{]' if char == '[' else '{'
+
+
+class RowsBuffer:
+    """
+    Файлоподобный объект для COPY: формирует csv по мере чтения,
+    не держа весь файл в памяти.
+    """
+
+    def __init__(self, rows, fields):
+        self.rows = rows
+        self.fields = fields
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def read(self, size=-1):
+        size = size if size > 0 else io.DEFAULT_BUFFER_SIZE
+        while self.buffer.tell() < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow([row[field] for field in self.fields])
+        value = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return value
+
+    readline = read
 
 
 class Command(BaseCommand):
-    help = 'Import ingridients and tags to database from csv file'
+    help = (
+        'Import ingredients and tags from csv, json or jsonl files. '
+        'Existing rows are skipped, so the import can be repeated.'
+    )
 
-    def handle(self, *args, **kwargs):
-        path_to_file = os.path.join(
-            settings.BASE_DIR,
-            'data/',
-            'ingredients.csv'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Ingredients file (csv without header, json or jsonl).'
+        )
+        parser.add_argument(
+            '--tags-path',
+            default=os.path.join(settings.BASE_DIR, 'data', 'tags.csv'),
+            help='Tags file (csv without header, json or jsonl).'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='File format, by default taken from the file extension.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per INSERT statement.'
         )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Do not use the PostgreSQL COPY fast path.'
+        )
+
+    def get_format(self, path, file_format):
+        file_format = file_format or os.path.splitext(path)[1].lstrip('.')
+        if file_format not in FORMATS:
+            raise CommandError(f'Unknown format of {path}.')
+        return file_format
 
-        with open(path_to_file) as f:
-            rows = csv.DictReader(f, fieldnames=['name', 'measurement_unit'])
+    def read_rows(self, path, file_format, fields):
+        """Построчно читает записи файла как словари с полями fields."""
+        with open(path, encoding='utf-8') as file:
+            if file_format == 'csv':
+                rows = csv.DictReader(file, fieldnames=fields)
+            elif file_format == 'json':
+                rows = iter_json_array(file)
+            else:
+                rows = (json.loads(line) for line in file if line.strip())
             for row in rows:
-                try:
-                    Ingredient.objects.get_or_create(**row)
-                except IntegrityError:
-                    continue
-
-        path_to_file = os.path.join(
-            settings.BASE_DIR,
-            'data/',
-            'tags.csv'
-        )
+                yield {field: row[field] for field in fields}
+
+    def bulk_import(self, model, rows, fields, batch_size):
+        before = model.objects.count()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(
+                [model(**row) for row in batch],
+                ignore_conflicts=True
+            )
+        return model.objects.count() - before
+
+    def copy_import(self, model, rows, fields):
+        """COPY во временную таблицу и один INSERT ... ON CONFLICT."""
+        table = model._meta.db_table
+        columns = ', '.join(fields)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Только импортируемые столбцы: id и прочие столбцы без
+            # значений по умолчанию не должны требовать значений в COPY.
+            cursor.execute(
+                f'CREATE TEMP TABLE import_staging AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.cursor.copy_expert(
+                f'COPY import_staging ({columns}) FROM STDIN '
+                f'WITH (FORMAT csv)',
+                RowsBuffer(rows, fields)
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM import_staging '
+                f'ON CONFLICT DO NOTHING'
+            )
+            created = cursor.rowcount
+            # Таблица удаляется сразу, а не при фиксации: команда может
+            # выполняться внутри внешней транзакции.
+            cursor.execute('DROP TABLE import_staging')
+            return created
 
-        with open(path_to_file) as f:
-            rows = csv.DictReader(f, fieldnames=['name', 'slug', 'color'])
+    def import_file(self, model, path, fields, options):
+        file_format = self.get_format(path, options['format'])
+        read = 0
+
+        def counted(rows):
+            nonlocal read
             for row in rows:
-                try:
-                    Tag.objects.get_or_create(**row)
-                except IntegrityError:
-                    continue
+                read += 1
+                yield row
+
+        rows = counted(self.read_rows(path, file_format, fields))
+        start = perf_counter()
+        if connection.vendor == 'postgresql' and not options['no_copy']:
+            created = self.copy_import(model, rows, fields)
+        else:
+            created = self.bulk_import(
+                model, rows, fields, options['batch_size']
+            )
+        elapsed = perf_counter() - start
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: read {read}, '
+            f'created {created} in {elapsed:.2f}s '
+            f'({read / elapsed if elapsed else read:.0f} rows/s)'
+        )
+
+    def handle(self, *args, **options):
+        self.import_file(
+            Ingredient, options['path'], INGREDIENT_FIELDS, options
+        )
+        self.import_file(Tag, options['tags_path'], TAG_FIELDS, options)
+        # Массовая вставка не вызывает Tag.save(), который назначает бит.
+        Tag.objects.assign_bits()
+        rows_imported.send(sender=Ingredient)
+        rows_imported.send(sender=Tag)
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.4 on 2026-10-17 19:47
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRESQL_SEARCH = (
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()
+    """,
+    "UPDATE recipes_recipe SET name = name",
+    """
+    CREATE INDEX recipe_search_vector_idx
+    ON recipes_recipe USING gin (search_vector)
+    """,
+)
+POSTGRESQL_SEARCH_REVERSE = (
+    "DROP INDEX IF EXISTS recipe_search_vector_idx",
+    "DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger "
+    "ON recipes_recipe",
+    "DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()",
+)
+# В SQLite (режим DEBUG) индекс FTS5 обновляют сигналы Recipe:
+# триггеры не переживают пересоздание таблицы миграциями SQLite.
+SQLITE_SEARCH = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts
+    USING fts5(name, text, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+    """
+    INSERT INTO recipes_recipe_fts (rowid, name, text)
+    SELECT id, name, text FROM recipes_recipe
+    """,
+)
+SQLITE_SEARCH_REVERSE = (
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+)
+
+
+def run(statements):
+    def execute(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return execute
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.CreateModel(
+            name='RecipeSearchIndex',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='recipes.recipe')),
+                ('name', models.TextField()),
+                ('text', models.TextField()),
+            ],
+            options={
+                'db_table': 'recipes_recipe_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            run({
+                'postgresql': POSTGRESQL_SEARCH,
+                'sqlite': SQLITE_SEARCH,
+            }),
+            run({
+                'postgresql': POSTGRESQL_SEARCH_REVERSE,
+                'sqlite': SQLITE_SEARCH_REVERSE,
+            }),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.4 on 2026-10-17 20:00
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from recipes.constants import MAX_TAG_BITS
+
+
+def fill_tag_masks(apps, schema_editor):
+    """
+    Биты получают первые MAX_TAG_BITS тегов по id, остальные
+    остаются без бита и в маску не входят.
+    """
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    tags = list(Tag.objects.order_by('id')[:MAX_TAG_BITS])
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ('bit',))
+    bits = {tag.id: tag.bit for tag in tags}
+    masks = defaultdict(int)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        tag_id__in=bits
+    ).values_list('recipe_id', 'tag_id').iterator():
+        masks[recipe_id] |= 1 << bits[tag_id]
+    Recipe.objects.bulk_update(
+        [Recipe(id=pk, tag_mask=mask) for pk, mask in masks.items()],
+        ('tag_mask',),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.RunPython(fill_tag_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.4 on 2026-10-17 20:02
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Favorite', 'recipe', 'Recipe', 'favorites_count'),
+    ('ShoppingCart', 'recipe', 'Recipe', 'in_carts_count'),
+    ('Follow', 'author', 'User', 'followers_count'),
+    ('Follow', 'user', 'User', 'following_count'),
+    ('Recipe', 'author', 'User', 'recipes_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, counter in COUNTERS:
+        model = apps.get_model('recipes', model_name)
+        apps.get_model('recipes', related_name).objects.update(**{
+            counter: Coalesce(
+                models.Subquery(
+                    model.objects.filter(
+                        **{field: models.OuterRef('pk')}
+                    ).order_by().values(field).annotate(
+                        total=models.Count('pk')
+                    ).values('total')
+                ),
+                0
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_tag_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+from copy import deepcopy
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models.fields.files import FieldFile
 from django.core.validators import MinValueValidator, RegexValidator
 
 from .constants import (
@@ -8,12 +12,40 @@ from .constants import (
     MAX_LENGTH_EMAIL,
     MAX_LENGTH_USER_MODEL,
     MIN_VALUE_FIELD_AMOUNT_COOKINGTIME,
-    HEX_COLOR_REGEX
+    HEX_COLOR_REGEX,
+    MAX_TAG_BITS,
+    SEARCH_FTS_TABLE
 )
 
 
+class TagQuerySet(models.QuerySet):
+    """QuerySet тегов."""
+
+    def free_bits(self):
+        """Свободные номера битов для маски тегов рецепта."""
+        used = set(self.exclude(bit=None).values_list('bit', flat=True))
+        return [bit for bit in range(MAX_TAG_BITS) if bit not in used]
+
+    def assign_bits(self):
+        """
+        Назначает свободные биты тегам без бита, например после
+        bulk_create, который не вызывает save(). Возвращает теги,
+        у которых не было бита: тем, кому бита не хватило, он
+        так и не назначается.
+        """
+        tags = list(self.filter(bit=None).order_by('id'))
+        for tag, bit in zip(tags, self.free_bits()):
+            tag.bit = bit
+        self.bulk_update(tags, ('bit',))
+        return tags
+
+
 class Tag(models.Model):
-    """Tag."""
+    """
+    Tag.
+    Первые MAX_TAG_BITS тегов получают бит в Recipe.tag_mask,
+    остальные остаются без бита и фильтруются по связям рецептов.
+    """
     name = models.CharField(
         'Название',
         max_length=MAX_LENGTH_TEXT_FIELD,
@@ -34,6 +66,14 @@ class Tag(models.Model):
             ),
         )
     )
+    bit = models.PositiveSmallIntegerField(
+        'Бит в маске тегов рецепта',
+        unique=True,
+        null=True,
+        editable=False,
+    )
+
+    objects = TagQuerySet.as_manager()
 
     class Meta:
         ordering = ('name',)
@@ -43,6 +83,32 @@ class Tag(models.Model):
     def __str__(self) -> str:
         return self.name
 
+    @property
+    def mask(self):
+        return 0 if self.bit is None else 1 << self.bit
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.bit is not None:
+            super().save(*args, **kwargs)
+            return
+        # Параллельно созданный тег может занять выбранный бит:
+        # тогда берется следующий свободный.
+        for _ in range(MAX_TAG_BITS + 1):
+            free_bits = Tag.objects.free_bits()
+            self.bit = free_bits[0] if free_bits else None
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if self.bit is None or not Tag.objects.filter(
+                    bit=self.bit
+                ).exists():
+                    self.bit = None
+                    raise
+        self.bit = None
+        super().save(*args, **kwargs)
+
 
 class Ingredient(models.Model):
     """Ingredient."""
@@ -70,7 +136,110 @@ class Ingredient(models.Model):
         return f'{self.name} - {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов."""
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты рецептов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
+    def with_user_flags(self, user):
+        """
+        Добавляет флаги is_favorited и is_in_shopping_cart
+        для пользователя одним запросом на всю выборку.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False)
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    recipe=models.OuterRef('pk'),
+                    user=user
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    recipe=models.OuterRef('pk'),
+                    user=user
+                )
+            )
+        )
+
+
+class DenormalizedFieldsMixin:
+    """
+    Поля denormalized_fields меняют только запросы UPDATE с F()
+    и пересчеты. Полное сохранение объекта их не записывает, чтобы не
+    затереть изменения параллельных запросов прочитанными значениями.
+    Поля background_fields меняет еще и фоновая обработка: полное
+    сохранение записывает их, только если их присвоили после загрузки
+    объекта из базы.
+    """
+    denormalized_fields = ()
+    background_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_background_fields()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self.remember_background_fields(fields)
+
+    def background_values(self, names=None):
+        """Значения загруженных полей background_fields для сравнения."""
+        deferred = self.get_deferred_fields()
+        values = {}
+        for name in self.background_fields:
+            field = self._meta.get_field(name)
+            if field.attname in deferred or (
+                names is not None and name not in names
+            ):
+                continue
+            value = getattr(self, field.attname)
+            values[name] = (
+                value.name if isinstance(value, FieldFile)
+                else deepcopy(value)
+            )
+        return values
+
+    def remember_background_fields(self, names=None):
+        self._background_values = {
+            **getattr(self, '_background_values', {}),
+            **self.background_values(names)
+        }
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            loaded = getattr(self, '_background_values', {})
+            unchanged = {
+                name for name, value in self.background_values().items()
+                if name in loaded and loaded[name] == value
+            }
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.denormalized_fields
+                and field.name not in unchanged
+            ]
+        super().save(*args, **kwargs)
+        self.remember_background_fields(kwargs.get('update_fields'))
+
+
+class Recipe(DenormalizedFieldsMixin, models.Model):
     """Recipe."""
     name = models.CharField(
         max_length=MAX_LENGTH_TEXT_FIELD,
@@ -101,6 +270,32 @@ class Recipe(models.Model):
         'Картинка',
         upload_to='recipes/images/',
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    tag_mask = models.BigIntegerField(
+        'Маска тегов',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
     ingredients = models.ManyToManyField(
         'Ingredient',
         through='RecipeIngredient',
@@ -108,15 +303,61 @@ class Recipe(models.Model):
         verbose_name='ингредиенты',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
+    denormalized_fields = (
+        'favorites_count',
+        'in_carts_count',
+        'tag_mask',
+        'search_vector',
+    )
+    # Фоновая обработка переключает рецепт на обработанное
+    # изображение и удаляет исходный файл.
+    background_fields = ('image', 'image_variants')
+
     class Meta:
         ordering = ('-pub_date', 'name')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            # Лента рецептов и ее страницы по курсору (сортировка + id).
+            models.Index(
+                fields=('-pub_date', 'name', 'id'),
+                name='recipe_feed_idx'
+            ),
+            # Рецепты автора и последние рецепты в подписках.
+            models.Index(
+                fields=('author', '-pub_date', 'name', 'id'),
+                name='recipe_author_feed_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.name
 
 
+class RecipeSearchIndex(models.Model):
+    """
+    Recipe search index.
+    Таблица FTS5 для поиска рецептов в SQLite (режим DEBUG), создается
+    миграцией. В PostgreSQL поиск идет по Recipe.search_vector.
+    """
+    recipe = models.OneToOneField(
+        'Recipe',
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_index'
+    )
+    name = models.TextField()
+    text = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = SEARCH_FTS_TABLE
+
+
 class RecipeIngredient(models.Model):
     """Recipe-Ingredient."""
     ingredient = models.ForeignKey(
@@ -176,6 +417,43 @@ class ShoppingCart(models.Model):
         return f'{self.user} - {self.recipe}'
 
 
+class ShoppingListItem(models.Model):
+    """
+    Shopping list item.
+    Сумма ингредиента по всем рецептам из списка покупок пользователя,
+    обновляется при изменении списка покупок и ингредиентов рецептов.
+    """
+    user = models.ForeignKey(
+        'User',
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        'Ingredient',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        'Количество',
+        default=0
+    )
+
+    class Meta:
+        ordering = ('user', 'ingredient')
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item_constraint'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
 class Favorite(models.Model):
     """Favorite."""
     user = models.ForeignKey(
@@ -244,7 +522,7 @@ class Follow(models.Model):
         return (f'{self.user} follow to {self.author}')
 
 
-class User(AbstractUser):
+class User(DenormalizedFieldsMixin, AbstractUser):
     """User."""
     username = models.CharField(
         'Логин',
@@ -264,6 +542,21 @@ class User(AbstractUser):
         max_length=MAX_LENGTH_EMAIL,
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+    )
+    following_count = models.PositiveIntegerField(
+        'Подписок',
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = (
@@ -271,6 +564,11 @@ class User(AbstractUser):
         'first_name',
         'last_name',
     )
+    denormalized_fields = (
+        'recipes_count',
+        'followers_count',
+        'following_count',
+    )
 
     class Meta:
         ordering = ('-username',)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Строки модели sender добавлены массовой вставкой без post_save.
+rows_imported = Signal()
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from recipes.management.commands.import_data import iter_json_array
+from recipes.models import Ingredient, Tag
+from recipes.signals import rows_imported
+
+INGREDIENTS = [
+    {'name': 'мука', 'measurement_unit': 'г'},
+    {'name': 'соль "Экстра", {йодированная}', 'measurement_unit': 'г'},
+    {'name': 'молоко', 'measurement_unit': 'мл'},
+]
+TAGS = [
+    {'name': 'Завтрак', 'slug': 'breakfast', 'color': '#E26C2D'},
+]
+
+
+class JsonArrayTest(SimpleTestCase):
+    """Чтение массива JSON по частям."""
+
+    def test_matches_json_load(self):
+        text = json.dumps(INGREDIENTS, ensure_ascii=False, indent=2)
+        for chunk_size in (1, 7, len(text)):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    list(iter_json_array(io.StringIO(text), chunk_size)),
+                    INGREDIENTS
+                )
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array(io.StringIO(' [ ] '))), [])
+
+    def test_invalid_files(self):
+        for text in ('', '{}', '[{"name": 1}', '[{"name": 1} {}]', '[1]'):
+            with self.subTest(text=text), self.assertRaises(CommandError):
+                list(iter_json_array(io.StringIO(text), 4))
+
+
+class ImportDataTest(TestCase):
+    """Импорт ингредиентов и тегов из csv, json и jsonl."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.imported = []
+
+        def receiver(sender, **kwargs):
+            self.imported.append(sender)
+
+        rows_imported.connect(receiver)
+        self.addCleanup(rows_imported.disconnect, receiver)
+
+    def write(self, name, rows, file_format):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            if file_format == 'json':
+                json.dump(rows, file, ensure_ascii=False)
+            elif file_format == 'jsonl':
+                file.writelines(
+                    json.dumps(row, ensure_ascii=False) + '\n'
+                    for row in rows
+                )
+            else:
+                csv.writer(file).writerows(row.values() for row in rows)
+        return path
+
+    def import_data(self, file_format):
+        call_command(
+            'import_data',
+            path=self.write(
+                f'ingredients.{file_format}',
+                INGREDIENTS + INGREDIENTS[:1],
+                file_format
+            ),
+            tags_path=self.write(f'tags.{file_format}', TAGS, file_format),
+            stdout=io.StringIO()
+        )
+
+    def test_formats(self):
+        for file_format in ('csv', 'json', 'jsonl'):
+            with self.subTest(file_format=file_format):
+                Ingredient.objects.all().delete()
+                Tag.objects.all().delete()
+                self.import_data(file_format)
+                self.assertCountEqual(
+                    Ingredient.objects.values('name', 'measurement_unit'),
+                    INGREDIENTS
+                )
+                self.assertCountEqual(
+                    Tag.objects.values('name', 'slug', 'color'), TAGS
+                )
+                self.assertFalse(Tag.objects.filter(bit=None).exists())
+
+    def test_repeated_import(self):
+        self.import_data('csv')
+        self.import_data('json')
+        self.assertEqual(Ingredient.objects.count(), len(INGREDIENTS))
+        self.assertEqual(Tag.objects.count(), len(TAGS))
+        self.assertEqual(self.imported, [Ingredient, Tag] * 2)
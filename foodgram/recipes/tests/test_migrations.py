@@ -0,0 +1,56 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from recipes.constants import MAX_TAG_BITS
+
+BEFORE = [('recipes', '0012_recipe_search')]
+AFTER = [('recipes', '0013_tag_mask')]
+
+
+class TagMaskMigrationTest(TransactionTestCase):
+    """Миграция 0013 при тегах сверх числа битов маски."""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_extra_tags_have_no_bit(self):
+        self.addCleanup(
+            self.migrate,
+            MigrationExecutor(connection).loader.graph.leaf_nodes()
+        )
+        apps = self.migrate(BEFORE)
+        Tag = apps.get_model('recipes', 'Tag')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        User = apps.get_model('recipes', 'User')
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', slug=f'tag{number}', color='#FFFFFF'
+            )
+            for number in range(MAX_TAG_BITS + 2)
+        ]
+        recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+            author=User.objects.create(
+                username='author', email='author@example.com'
+            )
+        )
+        recipe.tags.set([tags[0], tags[MAX_TAG_BITS - 1], tags[-1]])
+
+        apps = self.migrate(AFTER)
+        Tag = apps.get_model('recipes', 'Tag')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        self.assertEqual(
+            list(Tag.objects.order_by('id').values_list('bit', flat=True)),
+            [*range(MAX_TAG_BITS), None, None]
+        )
+        self.assertEqual(
+            Recipe.objects.get().tag_mask,
+            1 | 1 << (MAX_TAG_BITS - 1)
+        )